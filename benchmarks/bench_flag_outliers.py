@@ -0,0 +1,46 @@
+"""
+Compare the "loop" and "batch" methods of
+:func:`tigro.utils.flag_outliers.flag_outliers` on a synthetic stack of
+masked 1024x1024 frames with outliers.
+
+Run with ``python benchmarks/bench_flag_outliers.py [n_frames] [size]``.
+"""
+
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from tigro.utils.flag_outliers import flag_outliers
+
+
+def make_stack(n_frames=8, size=1024, dtype=np.float64, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.indices((size, size))
+    pupil = (x - size / 2) ** 2 + ((y - size / 2) / 0.8) ** 2 < (0.45 * size) ** 2
+    data = rng.normal(scale=10.0, size=(n_frames, size, size)).astype(dtype)
+    # Sparse spikes to be flagged
+    idx = rng.integers(0, size, size=(2, 50))
+    data[:, idx[0], idx[1]] = 1e5
+    mask = np.broadcast_to(~pupil, data.shape).copy()
+    return np.ma.masked_array(data, mask=mask)
+
+
+def main(n_frames=8, size=1024):
+    for dtype in (np.float64, np.float32):
+        rawmap = make_stack(n_frames, size, dtype)
+        elapsed, masks = {}, {}
+        for method in ("loop", "batch"):
+            start = perf_counter()
+            masks[method] = flag_outliers(0, rawmap, method=method).mask
+            elapsed[method] = perf_counter() - start
+        assert np.array_equal(masks["loop"], masks["batch"])
+        print(
+            f"{n_frames}x{size}x{size} {np.dtype(dtype).name}: "
+            f"loop {elapsed['loop']:.2f} s, batch {elapsed['batch']:.2f} s, "
+            f"speedup {elapsed['loop'] / elapsed['batch']:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
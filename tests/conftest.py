@@ -0,0 +1,46 @@
+import h5py
+import numpy as np
+import pytest
+from paos.classes.zernike import PolyOrthoNorm
+
+WAVELENGTH = 632.8
+
+
+def _basis(n=128, N=15):
+    # Orthonormal Zernike basis over an elliptical pupil
+    y, x = np.indices((n, n))
+    a, b = 0.44 * n, 0.3 * n
+    xx, yy = (x - n // 2) / a, (y - n // 2) / a
+    mask = xx**2 + (yy * a / b) ** 2 > 1
+    rho = np.ma.MaskedArray(np.sqrt(xx**2 + yy**2), mask=mask, fill_value=0.0)
+    phi = np.ma.MaskedArray(np.arctan2(yy, xx), mask=mask, fill_value=0.0)
+    return PolyOrthoNorm(N, rho, phi, normalize=False)(), mask
+
+
+@pytest.fixture
+def basis():
+    return _basis()
+
+
+@pytest.fixture
+def datapath(tmp_path):
+    # One multi-measurement .4D file, surfaces in waves, NaN outside the pupil
+    rng = np.random.default_rng(0)
+    zkm, mask = _basis()
+    with h5py.File(tmp_path / "273_0_+g_test.4D", "w") as fs:
+        group = fs.create_group("Measurement")
+        group.attrs["NumOfMeasurements"] = 3
+        for k in range(3):
+            item = group.create_group(f"Measurement_{k}")
+            item.attrs["WavelengthInNanometers"] = WAVELENGTH
+            coeff = rng.normal(scale=0.1, size=len(zkm))
+            data = np.tensordot(coeff, zkm.data, axes=1)
+            data += rng.normal(scale=1e-3, size=data.shape)
+            data[mask] = np.nan
+            item.create_group("SurfaceInWaves").create_dataset(
+                "Data", data=data.astype(np.float32)
+            )
+            item.create_group("Metadata").attrs["Timestamp"] = np.bytes_(
+                f"2024-01-0{k + 1}T00:00:00"
+            )
+    return str(tmp_path)
@@ -0,0 +1,12 @@
+import os
+import stat
+
+from tigro.io import catalogue as cat
+
+
+def test_catalogue_index_mode(datapath):
+    catalogue = cat.Catalogue(datapath)
+
+    assert [entry["count"] for entry in catalogue.files(273)] == [3]
+    # As a file created with open(), not the 0600 of mkstemp
+    assert stat.S_IMODE(os.stat(catalogue.fname).st_mode) == cat._FILE_MODE
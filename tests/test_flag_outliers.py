@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from scipy.signal import medfilt2d
+
+from tigro.utils.flag_outliers import _median3x3, flag_outliers
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (5, 7), (67, 130)])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_median3x3_medfilt2d(shape, dtype):
+    ima = np.random.default_rng(0).normal(size=shape).astype(dtype)
+    ima.flat[::11] = np.inf
+    np.testing.assert_array_equal(
+        _median3x3(ima, chunk_size=64), medfilt2d(ima, 3)
+    )
+
+
+@pytest.mark.parametrize("kernel_size", [3, 5])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_flag_outliers_methods(kernel_size, dtype):
+    rng = np.random.default_rng(1)
+    y, x = np.indices((96, 80))
+    mask = (x - 40) ** 2 + (y - 48) ** 2 > 35**2
+    data = rng.normal(scale=10.0, size=(4, 96, 80)).astype(dtype)
+    data[:, 48, 40] = data[1, 20, 30] = 1e5
+    rawmap = np.ma.masked_array(data, mask=np.broadcast_to(mask, data.shape).copy())
+
+    loop = flag_outliers(0, rawmap, kernel_size=kernel_size, sigma=5, method="loop")
+    batch = flag_outliers(0, rawmap, kernel_size=kernel_size, sigma=5)
+
+    assert batch.dtype == dtype
+    assert batch.mask[:, 48, 40].all() and batch.mask[1, 20, 30]
+    np.testing.assert_array_equal(loop.mask, batch.mask)
+    np.testing.assert_array_equal(rawmap.mask, np.broadcast_to(mask, data.shape))
@@ -0,0 +1,53 @@
+import numpy as np
+
+from tigro.core.fit_polynomial import PolynomialFitter
+from tigro.io.cache import FrameCache
+from tigro.io.load import load_phmap
+
+
+def test_fit_coefficients_float32(datapath, basis):
+    zkm, _ = basis
+    phmap = {
+        dtype: load_phmap(datapath, [273], dtype=dtype)[0][273]
+        for dtype in (np.float32, np.float64)
+    }
+    fitters = {
+        np.float32: PolynomialFitter(zkm.astype(np.float32)),
+        np.float64: PolynomialFitter(zkm),
+    }
+
+    for number in phmap[np.float64]:
+        assert phmap[np.float32][number].dtype == np.float32
+        _, coeff32 = fitters[np.float32].fit(273, phmap[np.float32][number])
+        _, coeff64 = fitters[np.float64].fit(273, phmap[np.float64][number])
+
+        # Coefficients are tens of nm: float32 maps must agree to 1e-4 nm
+        assert np.abs(coeff64).max() > 10.0
+        np.testing.assert_allclose(coeff32, coeff64, rtol=0, atol=1e-4)
+
+
+def test_cache_keeps_float64(datapath, tmp_path):
+    cache = FrameCache(tmp_path / "cache")
+    load_phmap(datapath, [273], dtype=np.float32, cache=cache)
+    cached = load_phmap(datapath, [273], dtype=np.float64, cache=cache)[0][273]
+    decoded = load_phmap(datapath, [273], dtype=np.float64)[0][273]
+
+    for number in decoded:
+        assert cached[number].dtype == np.float64
+        np.testing.assert_array_equal(
+            cached[number].filled(np.nan), decoded[number].filled(np.nan)
+        )
+
+
+def test_cache_region_copy(datapath, tmp_path):
+    cache = FrameCache(tmp_path / "cache")
+    load_phmap(datapath, [273], cache=cache)
+    cached = load_phmap(datapath, [273], down_sampling=4, cache=cache)[0][273]
+    decoded = load_phmap(datapath, [273], down_sampling=4)[0][273]
+
+    for number in decoded:
+        # Only the selected pixels are kept, not the whole cached array
+        assert np.ma.getdata(cached[number]).base.size == 32 * 32
+        np.testing.assert_array_equal(
+            cached[number].filled(np.nan), decoded[number].filled(np.nan)
+        )
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from tigro.io.load import load_phmap, sort_phmap
+from tigro.utils.pyramid import add_pyramids, downsample
+
+
+@pytest.mark.parametrize("as_cube", [False, True])
+def test_add_pyramids_load_phmap(datapath, as_cube):
+    data, meta = add_pyramids(load_phmap(datapath, [273], as_cube=as_cube), (2, 4))
+    rawmap, metadata = sort_phmap(data, meta)
+
+    pyramid = metadata[273]["pyramid"]
+    assert sorted(pyramid) == [2, 4]
+    for level, maps in pyramid.items():
+        expected = downsample(rawmap[273], level)
+        assert maps.shape == (3,) + expected.shape[1:]
+        np.testing.assert_array_equal(maps.mask, expected.mask)
+        np.testing.assert_allclose(maps.filled(0), expected.filled(0))
+
+
+def test_add_pyramids_phmap(datapath):
+    rawmap, _ = sort_phmap(*load_phmap(datapath, [273]))
+    phmap = add_pyramids({273: {"rawmap": rawmap[273]}}, (2,))
+    assert phmap[273]["pyramid"][2].shape == (3, 64, 64)
+
+    assert "pyramid" not in add_pyramids({273: {"rawmap": rawmap[273]}}, ())[273]
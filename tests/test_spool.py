@@ -0,0 +1,32 @@
+import pickle
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+
+from tigro.io.spool import Spool
+from tigro.plots.plot import plot_allpolys, plot_polys
+
+
+def test_spool_polynomial_plots_read_once(tmp_path, monkeypatch):
+    phmap = Spool(tmp_path / "spool")
+    for seq in range(4):
+        phmap[seq] = {"coeff": np.full(15, seq), "residual": np.zeros((8, 8))}
+
+    loads = []
+    load = pickle.load
+    monkeypatch.setattr(pickle, "load", lambda fs: loads.append(fs.name) or load(fs))
+
+    phmap = Spool(tmp_path / "spool")
+    sequence_ids = list(phmap)
+    plot_allpolys(phmap, sequence_ids, 0, NZernike=15, colors="rgbk")
+    assert len(loads) == 4
+
+    loads.clear()
+    plot_polys(phmap, sequence_ids, 0, poly_order=[5, 8], colors="rb")
+    assert len(loads) == 4
+
+    del phmap[3]
+    assert 3 not in phmap and len(phmap) == 3
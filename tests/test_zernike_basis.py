@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+from tigro.core.zernike_basis import _read_only
+
+
+def test_cached_basis_read_only():
+    zkm = np.ma.MaskedArray(np.ones((2, 3, 3)), mask=np.zeros((2, 3, 3), bool))
+    zkm = _read_only(zkm)
+
+    for array in (zkm, zkm.data, zkm.mask):
+        with pytest.raises(ValueError):
+            array[0, 0, 0] = 0
+    assert not zkm.mask.any() and (zkm == 1).all()
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+
+
+class FrameCube:
+    """
+    Contiguous stack of phase maps with a bit-packed mask.
+
+    The frames of a sequence are stored in a single preallocated
+    ``(N, Ny, Nx)`` array, optionally backed by ``.npy`` files opened as
+    memory maps, while the mask is kept packed along the last axis
+    (one bit per pixel). Frames are placed by measurement number, so the
+    cube is already sorted when loading completes and
+    :func:`tigro.io.load.sort_phmap` can wrap it without copying the data.
+
+    Parameters
+    ----------
+    numbers : list
+        Measurement numbers, in the order the frames are stored.
+    shape : tuple of int
+        Frame shape as ``(ny, nx)``.
+    dtype : data-type, optional
+        Data type of the cube (default: ``np.float64``).
+    path : str, optional
+        Path prefix of the on-disk memory maps. If given, the data and the
+        packed mask are written to ``<path>.npy`` and ``<path>_mask.npy``.
+        If None (default), the cube is held in memory.
+
+    Notes
+    -----
+    Frames that are never set stay fully masked.
+    """
+
+    def __init__(self, numbers, shape, dtype=np.float64, path=None):
+        self.numbers = list(numbers)
+        self.shape = (len(self.numbers),) + tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self._index = {number: i for i, number in enumerate(self.numbers)}
+
+        packed_shape = self.shape[:-1] + ((self.shape[-1] + 7) // 8,)
+        if path is None:
+            self.data = np.zeros(self.shape, dtype=self.dtype)
+            self.packed_mask = np.full(packed_shape, 255, dtype=np.uint8)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.data = np.lib.format.open_memmap(
+                f"{path}.npy", mode="w+", dtype=self.dtype, shape=self.shape
+            )
+            self.packed_mask = np.lib.format.open_memmap(
+                f"{path}_mask.npy", mode="w+", dtype=np.uint8, shape=packed_shape
+            )
+            self.packed_mask[:] = 255
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, i):
+        return np.ma.MaskedArray(
+            self.data[i], mask=self._unpack(self.packed_mask[i]), fill_value=0.0
+        )
+
+    def _unpack(self, packed):
+        return np.unpackbits(packed, axis=-1, count=self.shape[-1]).astype(bool)
+
+    def set_frame(self, number, data):
+        """
+        Write a frame into the slot of measurement ``number``.
+
+        Parameters
+        ----------
+        number : int or str
+            Measurement number, as listed in ``numbers``.
+        data : numpy.ma.MaskedArray
+            Frame of shape ``(ny, nx)``.
+        """
+        i = self._index[number]
+        self.data[i] = np.ma.getdata(data)
+        self.packed_mask[i] = np.packbits(np.ma.getmaskarray(data), axis=-1)
+
+    @property
+    def mask(self):
+        """Unpacked boolean mask of shape ``(N, Ny, Nx)``."""
+        return self._unpack(self.packed_mask)
+
+    def to_masked(self):
+        """
+        Return the cube as a masked array sharing the data buffer.
+
+        Returns
+        -------
+        numpy.ma.MaskedArray
+            Masked array of shape ``(N, Ny, Nx)`` whose data is a view on
+            the cube (no copy); only the mask is unpacked.
+        """
+        return np.ma.MaskedArray(
+            self.data, mask=self.mask, fill_value=0.0, copy=False
+        )
+
+    def flush(self):
+        """Flush the memory maps to disk, if any."""
+        if self.path is not None:
+            self.data.flush()
+            self.packed_mask.flush()
@@ -35,6 +35,25 @@ class Parser:
         self.store_phmap = system.getboolean("store_phmap", fallback=False)
         self.fname_phmap = system.get("fname_phmap")
         self.fname_phmap = os.path.join(self.outpath, self.fname_phmap)
+        self.store_format = system.get("store_format", fallback="pickle")
+        self.n_workers = system.getint("n_workers", fallback=1)
+        self.load_cube = system.getboolean("load_cube", fallback=False)
+        self.load_memmap = system.getboolean("load_memmap", fallback=False)
+        self.cache_dir = system.get("cache_dir", fallback="") or None
+        self.cache_size = system.getfloat("cache_size", fallback=10.0)
+        self.dtype = np.dtype(system.get("dtype", fallback="float64"))
+        self.down_sampling = system.getint("down_sampling", fallback=0) or None
+        self._pyramid_levels = system.get("pyramid_levels", fallback="")
+        self.pyramid_levels = tuple(
+            int(level) for level in self._pyramid_levels.split(",") if level.strip()
+        )
+        self._crop = system.get("crop", fallback="").strip()
+        self.crop = self._crop or None
+        if self.crop is not None and self.crop != "pupil":
+            self.crop = tuple(int(edge) for edge in self.crop.split(","))
+        self.crop_margin = system.getint("crop_margin", fallback=0)
+        self.checkpoints = system.getboolean("checkpoints", fallback=False)
+        self.checkpoints_keep = system.getint("checkpoints_keep", fallback=1)
         self.loglevel = system.get("loglevel")
         logger.setLevel(self.loglevel)
         logger.debug("System parameters read")
@@ -51,6 +70,7 @@ class Parser:
         if self.phmap_seq_ref not in self.sequence_ids:
             self.phmap_seq_ref = self.sequence_ids[0]
         self.n_zernike = cgvt.getint("n_zernike", fallback=15)
+        self.stream_sequences = cgvt.getboolean("stream_sequences", fallback=False)
         logger.debug("CGVT parameters read")
 
         # CGVT plots
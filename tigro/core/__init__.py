@@ -1,4 +1,14 @@
-from .fit_ellipse import fit_ellipse
-from .fit_polynomial import fit_polynomial
+from .fit_ellipse import fit_ellipse, fit_ellipses
+from .fit_polynomial import fit_polynomial, fit_polynomial_batch
+from .fit_polynomial import PolynomialFitter, PolynomialModel
+from .zernike_basis import zernike_basis
 
-__all__ = ["fit_ellipse", "fit_polynomial"]
+__all__ = [
+    "fit_ellipse",
+    "fit_ellipses",
+    "fit_polynomial",
+    "fit_polynomial_batch",
+    "PolynomialFitter",
+    "PolynomialModel",
+    "zernike_basis",
+]
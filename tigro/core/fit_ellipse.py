@@ -1,8 +1,138 @@
 import numpy as np
+import cv2
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from tigro.utils import LsqEllipseNew
 
+ELLIPSE_DTYPE = np.dtype(
+    [
+        ("a", float),
+        ("b", float),
+        ("xc", float),
+        ("yc", float),
+        ("phi", float),
+        ("rf_inverted", bool),
+        ("n_iter", int),
+    ]
+)
 
-def fit_ellipse(sequence, mask, boundary_th=0.65):
+
+def _gradient_boundary(mask, boundary_th):
+    # Pixels where the gradient magnitude of the inverted mask is large
+    data_mask = 1.0 - mask.astype(float)
+    Grad = np.gradient(data_mask)
+    boundary = np.sqrt(Grad[0] ** 2 + Grad[1] ** 2)
+    idx = np.where(boundary.flatten() > boundary_th)[0]
+    XX = idx % boundary.shape[1]
+    YY = idx // boundary.shape[1]
+    return XX, YY
+
+
+def _gradient_boundary_stack(masks, boundary_th):
+    # Same selection as _gradient_boundary over a (N, Ny, Nx) stack. The
+    # mask is 0/1, so twice its np.gradient is an exact small integer and
+    # the whole pass runs in int8 instead of float64 temporaries.
+    d = masks.view(np.int8)
+    grad2 = []
+    for axis in (1, 2):
+
+        def sl(start, stop):
+            return tuple(
+                slice(start, stop) if i == axis else slice(None) for i in range(3)
+            )
+
+        g = np.empty(d.shape, dtype=np.int8)
+        np.subtract(d[sl(2, None)], d[sl(None, -2)], out=g[sl(1, -1)])
+        g[sl(0, 1)] = 2 * (d[sl(1, 2)] - d[sl(0, 1)])
+        g[sl(-1, None)] = 2 * (d[sl(-1, None)] - d[sl(-2, -1)])
+        grad2.append(g)
+
+    boundary = grad2[0] * grad2[0] + grad2[1] * grad2[1] > 4 * boundary_th**2
+    kk, YY, XX = np.nonzero(boundary)
+    split = np.searchsorted(kk, np.arange(1, masks.shape[0]))
+    return zip(np.split(XX, split), np.split(YY, split))
+
+
+def _contour_boundary(mask):
+    # Outer contour of the largest unmasked region
+    contours, _ = cv2.findContours(
+        (~mask).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
+    )
+    if not contours:
+        raise ValueError("mask has no unmasked region.")
+    # int32 contour points would overflow in the conic design matrix
+    contour = max(contours, key=cv2.contourArea).reshape(-1, 2).astype(float)
+    return contour[:, 0], contour[:, 1]
+
+
+def _select_annulus(XX, YY, guess, annulus):
+    # Keep the points within `annulus` pixels of the guess ellipse, unless
+    # too few are left for a conic fit
+    c, s = np.cos(guess["phi"]), np.sin(guess["phi"])
+    xp = c * (XX - guess["xc"]) + s * (YY - guess["yc"])
+    yp = -s * (XX - guess["xc"]) + c * (YY - guess["yc"])
+    r = np.sqrt((xp / guess["a"]) ** 2 + (yp / guess["b"]) ** 2)
+    sel = np.abs(r - 1.0) <= annulus / min(guess["a"], guess["b"])
+
+    if np.count_nonzero(sel) < 6:
+        return XX, YY
+    return XX[sel], YY[sel]
+
+
+def _fit_reject_inside(XX, YY, max_iter):
+    # Remove outliers inside the edge
+    for _iter_ in range(max_iter):
+        _ellipse = LsqEllipseNew().fit(np.c_[XX, YY])
+        cond = _ellipse.inside(XX, YY)
+
+        if not np.any(cond):
+            break
+
+        XX = XX[~cond]
+        YY = YY[~cond]
+    else:
+        raise RuntimeError("Ellipse filtering did not converge")
+
+    return _ellipse, _iter_ + 1
+
+
+def _fit_robust(XX, YY, clip, max_iter):
+    # Reject points whose normalized elliptical radius deviates from 1 by
+    # more than `clip` robust (MAD) standard deviations, then refit
+    keep = np.ones(XX.size, dtype=bool)
+    for _iter_ in range(max_iter):
+        _ellipse = LsqEllipseNew().fit(np.c_[XX[keep], YY[keep]])
+        (xc, yc), a, b, phi = _ellipse.as_parameters()
+
+        c, s = np.cos(phi), np.sin(phi)
+        xp = c * (XX - xc) + s * (YY - yc)
+        yp = -s * (XX - xc) + c * (YY - yc)
+        res = np.sqrt((xp / a) ** 2 + (yp / b) ** 2) - 1.0
+
+        mad = 1.4826 * np.median(np.abs(res[keep] - np.median(res[keep])))
+        # Never clip below one pixel, the quantization of the contour
+        tol = max(clip * mad, 1.0 / min(a, b))
+        new_keep = np.abs(res) <= tol
+
+        if np.array_equal(new_keep, keep):
+            break
+
+        keep = new_keep
+    else:
+        raise RuntimeError("Ellipse filtering did not converge")
+
+    return _ellipse, _iter_ + 1
+
+
+def fit_ellipse(
+    sequence,
+    mask,
+    boundary_th=0.65,
+    method="gradient",
+    clip=3.0,
+    max_iter=1000,
+    guess=None,
+    annulus=5.0,
+):
     """
     Fit an ellipse to the boundary of a masked 2D region.
 
@@ -22,6 +152,25 @@ def fit_ellipse(sequence, mask, boundary_th=0.65):
     boundary_th : float, optional
         Threshold applied to the gradient magnitude to select boundary pixels.
         Default is 0.65.
+    method : {"gradient", "contour"}, optional
+        Boundary extraction and rejection engine. "gradient" (default) is the
+        scheme described above. "contour" takes the outer contour of the
+        unmasked region with :func:`cv2.findContours`, which ignores holes
+        inside the pupil, and refits after sigma-clipping the normalized
+        radial residuals with a median absolute deviation estimate, which
+        usually converges in a few fits.
+    clip : float, optional
+        Rejection threshold of the "contour" engine, in robust standard
+        deviations. Default is 3.0.
+    max_iter : int, optional
+        Maximum number of least-squares fits. Default is 1000.
+    guess : dict, optional
+        Ellipse used as warm start, e.g. the result for the previous frame
+        of the sequence. Only the boundary pixels within `annulus` pixels of
+        it are fitted, which removes most interior points before the first
+        fit. Default is None.
+    annulus : float, optional
+        Half-width, in pixels, of the annulus around `guess`. Default is 5.
 
     Returns
     -------
@@ -35,31 +184,38 @@ def fit_ellipse(sequence, mask, boundary_th=0.65):
         - 'phi' : rotation angle (radians), following Wolfram ellipse notation
         - 'rf_inverted' : bool flag indicating whether axes were swapped to
           restore the reference-frame convention
+        - 'n_iter' : number of least-squares fits performed
+
+    Raises
+    ------
+    RuntimeError
+        If the rejection does not converge within `max_iter` fits.
     """
 
     if mask.dtype != np.bool_:
         raise ValueError("mask not bool array.")
 
-    data_mask = 1.0 - mask.astype(float)
-    Grad = np.gradient(data_mask)
-    boundary = np.sqrt(Grad[0] ** 2 + Grad[1] ** 2)
-    idx = np.where(boundary.flatten() > boundary_th)[0]
-    XX = idx % boundary.shape[1]
-    YY = idx // boundary.shape[1]
+    if method == "gradient":
+        XX, YY = _gradient_boundary(mask, boundary_th)
+    elif method == "contour":
+        XX, YY = _contour_boundary(mask)
+    else:
+        raise ValueError(f"Unknown method: {method}")
 
-    # Remove outliers inside the edge
-    max_iter = 1000
-    for _iter_ in range(max_iter):
-        _ellipse = LsqEllipseNew().fit(np.c_[XX, YY])
-        cond = _ellipse.inside(XX, YY)
+    if guess is not None:
+        XX, YY = _select_annulus(XX, YY, guess, annulus)
 
-        if not np.any(cond):
-            break
+    return _fit_boundary((XX, YY, method, clip, max_iter))
 
-        XX = XX[~cond]
-        YY = YY[~cond]
+
+def _fit_boundary(task):
+    # Fit the ellipse to boundary points; picklable for process pools
+    XX, YY, method, clip, max_iter = task
+
+    if method == "gradient":
+        _ellipse, n_iter = _fit_reject_inside(XX, YY, max_iter)
     else:
-        raise RuntimeError("Ellipse filtering did not converge")
+        _ellipse, n_iter = _fit_robust(XX, YY, clip, max_iter)
 
     (xc, yc), a, b, phi = _ellipse.as_parameters()
 
@@ -78,4 +234,92 @@ def fit_ellipse(sequence, mask, boundary_th=0.65):
         "yc": yc,
         "phi": phi,
         "rf_inverted": rf_inverted,
+        "n_iter": n_iter,
     }
+
+
+def fit_ellipses(
+    masks,
+    boundary_th=0.65,
+    method="gradient",
+    clip=3.0,
+    max_iter=1000,
+    n_workers=None,
+    executor="thread",
+    incremental=False,
+    annulus=5.0,
+):
+    """
+    Fit an ellipse to the boundary of every mask in a stack.
+
+    Batched counterpart of :func:`fit_ellipse`. With the "gradient" engine
+    the boundary pixels of all frames are extracted in a single vectorized
+    pass over the stack; the least-squares fits, which are independent,
+    then run concurrently in a thread or process pool.
+
+    Parameters
+    ----------
+    masks : ndarray (3D, boolean)
+        Stack of masks of shape (N, Ny, Nx). Masked pixels are assumed to
+        be `True`.
+    boundary_th : float, optional
+        Threshold applied to the gradient magnitude to select boundary pixels.
+        Default is 0.65.
+    method : {"gradient", "contour"}, optional
+        Boundary extraction and rejection engine, see :func:`fit_ellipse`.
+        Default is "gradient".
+    clip : float, optional
+        Rejection threshold of the "contour" engine. Default is 3.0.
+    max_iter : int, optional
+        Maximum number of least-squares fits per frame. Default is 1000.
+    n_workers : int, optional
+        Number of workers of the pool. Default is None, which lets
+        :mod:`concurrent.futures` decide.
+    executor : {"thread", "process"}, optional
+        Kind of pool used for the fits. Default is "thread".
+    incremental : bool, optional
+        If True, frames are fitted in order, each one warm-started from the
+        ellipse of the previous frame (see the `guess` argument of
+        :func:`fit_ellipse`). The pupil barely moves along a sequence, so
+        most frames converge in one or two fits. The fits are then
+        sequential and `n_workers` and `executor` are ignored.
+        Default is False.
+    annulus : float, optional
+        Half-width, in pixels, of the warm-start annulus. Default is 5.
+
+    Returns
+    -------
+    numpy.ndarray
+        Structured array of length N with fields ``a``, ``b``, ``xc``,
+        ``yc``, ``phi``, ``rf_inverted`` and ``n_iter``, as returned by
+        :func:`fit_ellipse` for each frame.
+    """
+    masks = np.asarray(masks)
+    if masks.dtype != np.bool_:
+        raise ValueError("mask not bool array.")
+
+    if method == "gradient":
+        points = _gradient_boundary_stack(masks, boundary_th)
+    elif method == "contour":
+        points = map(_contour_boundary, masks)
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
+    if incremental:
+        results = []
+        for XX, YY in points:
+            if results:
+                XX, YY = _select_annulus(XX, YY, results[-1], annulus)
+            results.append(_fit_boundary((XX, YY, method, clip, max_iter)))
+    else:
+        tasks = [(XX, YY, method, clip, max_iter) for XX, YY in points]
+
+        pool = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+        with pool(max_workers=n_workers) as ex:
+            results = list(ex.map(_fit_boundary, tasks))
+
+    retval = np.empty(len(results), dtype=ELLIPSE_DTYPE)
+    for i, res in enumerate(results):
+        retval[i] = tuple(res[name] for name in ELLIPSE_DTYPE.names)
+
+    return retval
@@ -1,7 +1,139 @@
+import hashlib
 import numpy as np
+from collections import OrderedDict
+from scipy.linalg import cho_factor, cho_solve
 from tigro.logging import logger
 
 
+class PolynomialModel:
+    """
+    Polynomial model stored as coefficients over a shared basis.
+
+    Instead of the full ``(N, Ny, Nx)`` cube ``coeff.reshape(-1, 1, 1) * zkm``,
+    the model keeps the fitted coefficients, the mask of the fitted image
+    and a reference to the basis, which is shared by all models fitted
+    with it. Surfaces are materialized on demand with a single
+    :func:`numpy.tensordot`.
+
+    Indexing (``model[k]``, ``model[:4]``), ``model.sum(...)`` and
+    ``np.sum(model, ...)`` return the same masked arrays as the
+    materialized cube, and ``model.filled()`` and ``np.asarray(model)``
+    materialize it. Other ``MaskedArray`` methods are not provided: use
+    :meth:`to_masked` to get the cube.
+
+    Parameters
+    ----------
+    coeff : array_like
+        Fitted coefficients, of length N.
+    zkm : numpy.ma.MaskedArray
+        Polynomial basis array of shape (N, Ny, Nx).
+    mask : numpy.ndarray, optional
+        2D mask of the fitted image. Default is None (basis mask only).
+
+    Notes
+    -----
+    When many models are pickled together (e.g. with the whole ``phmap``),
+    :mod:`pickle` stores the shared basis only once. Surfaces are evaluated
+    in the precision of the basis.
+    """
+
+    def __init__(self, coeff, zkm, mask=None):
+        self.coeff = np.asarray(coeff)
+        self.zkm = zkm
+        self.mask = np.ma.getmaskarray(zkm).any(axis=0)
+        if mask is not None:
+            self.mask = self.mask | mask
+
+    @property
+    def shape(self):
+        return self.zkm.shape
+
+    def __len__(self):
+        return len(self.coeff)
+
+    def __getitem__(self, idx):
+        coeff = self.coeff[idx].astype(self.zkm.dtype, copy=False)
+        data = np.reshape(coeff, np.shape(coeff) + (1, 1)) * self.zkm.data[idx]
+        return np.ma.MaskedArray(
+            data, mask=np.broadcast_to(self.mask, data.shape).copy()
+        )
+
+    def surface(self, terms=None, exclude=None):
+        """
+        Materialize the sum of a subset of the polynomial terms.
+
+        Parameters
+        ----------
+        terms : array_like of int, optional
+            Indices of the terms to include. Default is None (all terms).
+        exclude : array_like of int, optional
+            Indices of the terms to leave out, e.g. ``[0, 1, 2, 4]`` for the
+            piston, tip, tilt and defocus of an ANSI-ordered Zernike basis.
+            Default is None.
+
+        Returns
+        -------
+        numpy.ma.MaskedArray
+            2D model surface.
+        """
+        if terms is None:
+            terms = np.arange(len(self.coeff))
+        terms = np.asarray(terms)
+        if exclude is not None:
+            terms = terms[~np.isin(terms, exclude)]
+
+        coeff = self.coeff[terms].astype(self.zkm.dtype, copy=False)
+        data = np.tensordot(coeff, self.zkm.data[terms], axes=1)
+        return np.ma.MaskedArray(data, mask=self.mask.copy(), fill_value=0.0)
+
+    def to_masked(self):
+        """
+        Materialize the full cube.
+
+        Returns
+        -------
+        numpy.ma.MaskedArray
+            Cube of shape (N, Ny, Nx).
+        """
+        return self[:]
+
+    def filled(self, fill_value=None):
+        """Materialized cube with masked values filled, as ``MaskedArray.filled``."""
+        return self.to_masked().filled(fill_value)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.to_masked().data, dtype=dtype)
+
+    def sum(self, axis=None, dtype=None, out=None, keepdims=False):
+        """
+        Sum the model, as ``MaskedArray.sum`` on the materialized cube.
+
+        Sums over the terms (``axis=0``) and over everything
+        (``axis=None``) are computed from :meth:`surface` without
+        materializing the cube. Other axes materialize it.
+        """
+        if axis not in (None, 0, -3):
+            return self.to_masked().sum(
+                axis=axis, dtype=dtype, out=out, keepdims=keepdims
+            )
+
+        result = self.surface()
+        if axis is None:
+            result = result.sum(dtype=dtype)
+            if keepdims:
+                result = np.ma.reshape(result, (1, 1, 1))
+        else:
+            if dtype is not None:
+                result = result.astype(dtype)
+            if keepdims:
+                result = result[np.newaxis]
+
+        if out is not None:
+            out[...] = result
+            return out
+        return result
+
+
 def fit_polynomial(sequence, ima, zkm):
     """
     Fit a polynomial model to a 2D image using a masked polynomial basis.
@@ -13,7 +145,9 @@ def fit_polynomial(sequence, ima, zkm):
 
     The polynomial coefficients are obtained by solving the normal equations
     constructed from the inner products of the basis functions. The resulting
-    model is returned as a linear combination of the input basis.
+    model is returned as a linear combination of the input basis. The inner
+    products are accumulated in double precision, so single precision images
+    and bases yield float64 coefficients.
 
     Parameters
     ----------
@@ -27,9 +161,9 @@ def fit_polynomial(sequence, ima, zkm):
 
     Returns
     -------
-    model : numpy.ma.MaskedArray
-        Reconstructed model image(s), obtained as the linear combination
-        of the polynomial basis with the fitted coefficients.
+    model : PolynomialModel
+        Lazy model, i.e. the linear combination of the polynomial basis
+        with the fitted coefficients, evaluated on demand.
     coeff : numpy.ndarray
         Array of fitted polynomial coefficients of length N.
 
@@ -39,19 +173,217 @@ def fit_polynomial(sequence, ima, zkm):
         If `ima` is not a masked array.
     """
     logger.info(f"Fitting sequence {sequence}")
+    basis = zkm
     zkm = zkm.copy()
     if hasattr(ima, "mask"):
         zkm.mask |= ima.mask
     else:
         raise TypeError("plyfit expects polynomials as masked arrays")
 
-    A = np.einsum("ijk,ljk", zkm.filled(0), zkm.filled(0))
+    A = np.einsum("ijk,ljk", zkm.filled(0), zkm.filled(0), dtype=np.float64)
     A /= zkm[0].count()
 
     A[np.abs(A) < 1e-10] = 0.0
 
-    B = np.ma.mean(zkm * ima, axis=(-2, -1))
+    B = np.ma.mean(zkm * ima, axis=(-2, -1), dtype=np.float64)
     coeff = np.linalg.lstsq(A, B, rcond=-1)[0]
 
-    model = coeff.reshape(-1, 1, 1) * zkm
+    model = PolynomialModel(coeff, basis, np.ma.getmaskarray(ima))
     return model, coeff
+
+
+class PolynomialFitter:
+    """
+    Least-squares polynomial fitter caching the normal equations per mask.
+
+    Equivalent to :func:`fit_polynomial`, but the masked basis restricted
+    to the valid pixels and the Cholesky factorization of its Gram matrix
+    are computed once per unique image mask and kept in a bounded LRU
+    cache. Fitting an image that shares a mask with a previous one only
+    costs the projection onto the basis and two triangular solves.
+
+    The masked basis and the normal equations are kept in double precision
+    whatever the precision of the basis and of the images, which only
+    affects the memory footprint of the models.
+
+    Parameters
+    ----------
+    zkm : numpy.ma.MaskedArray
+        Polynomial basis array of shape (N, Ny, Nx), where N is the number
+        of basis functions. All basis functions are expected to share the
+        same mask.
+    maxsize : int, optional
+        Maximum number of masks kept in the cache. Default is 16.
+
+    Examples
+    --------
+    >>> fitter = PolynomialFitter(zkm)
+    >>> for num, ima in enumerate(regmap):
+    ...     model, coeff = fitter.fit(num, ima)
+    """
+
+    def __init__(self, zkm, maxsize=16):
+        if not hasattr(zkm, "mask"):
+            raise TypeError("plyfit expects polynomials as masked arrays")
+
+        self.zkm = zkm
+        self.maxsize = maxsize
+        self._basis_mask = np.ma.getmaskarray(zkm).any(axis=0)
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def _key(mask):
+        return hashlib.sha1(np.packbits(mask)).hexdigest()
+
+    def _factorize(self, mask):
+        key = self._key(mask)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        idx = np.flatnonzero(~mask)
+        Z = self.zkm.data.reshape(self.zkm.shape[0], -1)[:, idx].astype(
+            np.float64, copy=False
+        )
+
+        A = Z @ Z.T
+        A /= idx.size
+        A[np.abs(A) < 1e-10] = 0.0
+
+        try:
+            factor = cho_factor(A)
+        except np.linalg.LinAlgError:
+            logger.warning("Gram matrix not positive definite: using lstsq")
+            factor = None
+
+        entry = idx, Z, A, factor
+        self._cache[key] = entry
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+        return entry
+
+    def fit(self, sequence, ima):
+        """
+        Fit the polynomial basis to a 2D image.
+
+        Parameters
+        ----------
+        sequence : int
+            Sequence identifier, used only for logging purposes.
+        ima : numpy.ma.MaskedArray
+            Input 2D image to be fitted. Must be a masked array.
+
+        Returns
+        -------
+        model : PolynomialModel
+            Lazy model, as in :func:`fit_polynomial`.
+        coeff : numpy.ndarray
+            Array of fitted polynomial coefficients of length N.
+
+        Raises
+        ------
+        TypeError
+            If `ima` is not a masked array.
+        """
+        logger.info(f"Fitting sequence {sequence}")
+        if not hasattr(ima, "mask"):
+            raise TypeError("plyfit expects polynomials as masked arrays")
+
+        mask = self._basis_mask | np.ma.getmaskarray(ima)
+        idx, Z, A, factor = self._factorize(mask)
+
+        B = Z @ ima.data.ravel()[idx].astype(np.float64, copy=False)
+        B /= idx.size
+
+        coeff = self._solve(A, factor, B)
+
+        return self._model(coeff, mask), coeff
+
+    @staticmethod
+    def _solve(A, factor, B):
+        if factor is None:
+            return np.linalg.lstsq(A, B, rcond=-1)[0]
+        return cho_solve(factor, B)
+
+    def _model(self, coeff, mask):
+        return PolynomialModel(coeff, self.zkm, mask)
+
+    def fit_batch(self, images, return_models=False):
+        """
+        Fit the polynomial basis to a stack of images at once.
+
+        Frames are grouped by mask. For each group the valid pixels of all
+        frames are gathered into a ``(Nframes, Npix)`` matrix and projected
+        onto the ``(Nbasis, Npix)`` design matrix with a single matrix
+        product, then solved for all right-hand sides together.
+
+        Parameters
+        ----------
+        images : numpy.ma.MaskedArray or sequence of numpy.ma.MaskedArray
+            Images of shape (Nframes, Ny, Nx) to be fitted.
+        return_models : bool, optional
+            If True, also return the models. Default is False.
+
+        Returns
+        -------
+        coeff : numpy.ndarray
+            Fitted coefficients, of shape (Nframes, Nbasis).
+        models : list of PolynomialModel
+            Only if `return_models` is True. Lazy model of each frame, as
+            returned by :meth:`fit`.
+        """
+        masks = [self._basis_mask | np.ma.getmaskarray(ima) for ima in images]
+
+        groups = {}
+        for num, mask in enumerate(masks):
+            groups.setdefault(self._key(mask), []).append(num)
+        logger.info(f"Fitting {len(masks)} images in {len(groups)} mask groups")
+
+        coeff = np.empty((len(masks), self.zkm.shape[0]))
+        for members in groups.values():
+            idx, Z, A, factor = self._factorize(masks[members[0]])
+            Y = np.stack(
+                [np.ma.getdata(images[num]).ravel()[idx] for num in members],
+                dtype=np.float64,
+            )
+            B = Z @ Y.T
+            B /= idx.size
+            coeff[members] = self._solve(A, factor, B).T
+
+        if return_models:
+            models = [self._model(c, mask) for c, mask in zip(coeff, masks)]
+            return coeff, models
+
+        return coeff
+
+
+def fit_polynomial_batch(images, zkm, return_models=False):
+    """
+    Fit a polynomial model to a stack of 2D images in one pass.
+
+    Batched counterpart of :func:`fit_polynomial`: frames sharing a mask
+    are solved together with a single matrix product against the masked
+    basis. See :meth:`PolynomialFitter.fit_batch`.
+
+    Parameters
+    ----------
+    images : numpy.ma.MaskedArray or sequence of numpy.ma.MaskedArray
+        Images of shape (Nframes, Ny, Nx) to be fitted.
+    zkm : numpy.ma.MaskedArray
+        Polynomial basis array of shape (N, Ny, Nx), where N is the number
+        of basis functions. Must be a masked array.
+    return_models : bool, optional
+        If True, also return the lazy per-frame models.
+        Default is False.
+
+    Returns
+    -------
+    coeff : numpy.ndarray
+        Fitted coefficients, of shape (Nframes, N).
+    models : list of PolynomialModel
+        Only if `return_models` is True.
+    """
+    fitter = PolynomialFitter(zkm, maxsize=len(images))
+    return fitter.fit_batch(images, return_models=return_models)
@@ -1,6 +1,15 @@
+import os
+import numpy as np
+
 from tigro.classes.parser import Parser
 
-from tigro.io.load import load_phmap
+from tigro.io.load import load_phmap, resolve_crop
+from tigro.utils.pyramid import add_pyramids
+from tigro.io.cache import FrameCache
+from tigro.io.spool import Spool
+from tigro.io.processed import phmap_to_h5, h5_to_phmap
+from tigro.io.get_processed_sequence import find_processed_sequence
+from tigro.io.checkpoint import Checkpoints, hash_files, sequence_files
 from tigro.core.process import filter_phmap
 from tigro.utils.util import get_threshold
 from tigro.core.process import med_phmap
@@ -22,41 +31,127 @@ from tigro.plots.plot import plot_map
 from tigro import logger
 
 
+def _h5_tag(pp):
+    # Tag of the per-sequence HDF5 result files, taken from fname_phmap
+    return os.path.splitext(os.path.basename(pp.fname_phmap))[0]
+
+
+def stored_phmap_files(pp):
+    """
+    List the files holding the stored CGVT results.
+
+    Parameters
+    ----------
+    pp : tigro.classes.parser.Parser
+        Parsed configuration.
+
+    Returns
+    -------
+    list of str
+        ``pp.fname_phmap``, or the per-sequence HDF5 files if
+        ``pp.store_format`` is "h5".
+
+    Raises
+    ------
+    FileNotFoundError
+        If a file is missing.
+    """
+    if pp.store_format == "h5":
+        return [
+            find_processed_sequence(
+                int(sequence), pp.outpath, SN=_h5_tag(pp), ext=".h5"
+            )
+            for sequence in pp.sequence_ids
+        ]
+    if not os.path.exists(pp.fname_phmap):
+        raise FileNotFoundError(pp.fname_phmap)
+    return [pp.fname_phmap]
+
+
+def load_stored_phmap(pp):
+    """
+    Read the stored CGVT results, in the format given by ``pp.store_format``.
+
+    Parameters
+    ----------
+    pp : tigro.classes.parser.Parser
+        Parsed configuration.
+
+    Returns
+    -------
+    dict
+        Processed phase maps. With the "h5" format, polynomial models are
+        read back as their coefficients, see
+        :func:`tigro.io.processed.h5_to_phmap`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the stored results are missing.
+    """
+    if pp.store_format == "h5":
+        return h5_to_phmap(pp.outpath, pp.sequence_ids, SN=_h5_tag(pp))
+    return from_pickle(pp.fname_phmap)
+
+
 def run_cgvt(pp):
     if not pp.run_cgvt:
         return
 
     logger.info("Running CGVT")
 
-    logger.info("Loading phase maps")
-    phmap = load_phmap(pp.datapath, pp.sequence_ids)
+    cache = None
+    if pp.cache_dir is not None:
+        cache = FrameCache(pp.cache_dir, max_size=pp.cache_size * 1e9)
+
+    if pp.stream_sequences:
+        phmap, uref = run_cgvt_stream(pp, cache)
+    elif pp.checkpoints:
+        stages = cgvt_stages(pp, cache)
+        phmap = stages["zernike"].value
+        uref = stages["uref"].value
+    else:
+        logger.info("Loading phase maps")
+        phmap = load_phmap(
+            pp.datapath,
+            pp.sequence_ids,
+            down_sampling=pp.down_sampling,
+            n_workers=pp.n_workers,
+            as_cube=pp.load_cube,
+            memmap_dir=pp.outpath if pp.load_memmap else None,
+            dtype=pp.dtype,
+            cache=cache,
+            crop=pp.crop,
+            crop_margin=pp.crop_margin,
+        )
+        phmap = add_pyramids(phmap, pp.pyramid_levels)
 
-    logger.info("Filtering phase maps")
-    phmap = filter_phmap(phmap)
+        logger.info("Filtering phase maps")
+        phmap = filter_phmap(phmap)
 
-    logger.info("Getting threshold for outlier rejection")
-    threshold = get_threshold(phmap, pp.phmap_threshold)
+        logger.info("Getting threshold for outlier rejection")
+        threshold = get_threshold(phmap, pp.phmap_threshold)
 
-    logger.info("Computing median map and supermask")
-    phmap = med_phmap(
-        phmap,
-        threshold,
-        filter_type=pp.phmap_filter_type,
-    )
+        logger.info("Computing median map and supermask")
+        phmap = med_phmap(
+            phmap,
+            threshold,
+            filter_type=pp.phmap_filter_type,
+        )
 
-    logger.info("Fitting ellipse to phase maps")
-    phmap = fit_ellipse(phmap)
+        logger.info("Fitting ellipse to phase maps")
+        phmap = fit_ellipse(phmap)
 
-    logger.info("Registering phase maps")
-    phmap = register_phmap(phmap)
+        logger.info("Registering phase maps")
+        phmap = register_phmap(phmap)
 
-    logger.info("Getting reference map")
-    uref = get_uref(
-        phmap,
-        pp.phmap_semi_major,
-        pp.phmap_semi_minor,
-        pp.phmap_seq_ref,
-    )
+        logger.info("Getting reference map")
+        uref = get_uref(
+            phmap,
+            pp.phmap_semi_major,
+            pp.phmap_semi_minor,
+            pp.phmap_seq_ref,
+        )
 
     if pp.plot_regmap:
         logger.info("Plotting sag of registered phase map")
@@ -68,12 +163,13 @@ def run_cgvt(pp):
             outpath=pp.outpath,
         )
 
-    logger.info("Fitting Zernike orthonormal polynomials")
-    phmap = fit_zernike(
-        phmap,
-        uref,
-        NZernike=pp.n_zernike,
-    )
+    if not (pp.stream_sequences or pp.checkpoints):
+        logger.info("Fitting Zernike orthonormal polynomials")
+        phmap = fit_zernike(
+            phmap,
+            uref,
+            NZernike=pp.n_zernike,
+        )
 
     if pp.plot_regmap_no_pttf:
         logger.info(
@@ -87,7 +183,13 @@ def run_cgvt(pp):
             outpath=pp.outpath,
         )
 
-    if pp.store_phmap:
+    if pp.store_phmap and pp.store_format == "h5":
+        # A spool is written one sequence at a time
+        logger.info("Saving results to HDF5 files")
+        phmap_to_h5(phmap, pp.outpath, SN=_h5_tag(pp))
+    elif pp.store_phmap and pp.stream_sequences:
+        logger.info(f"Results stored per sequence in {phmap.path}")
+    elif pp.store_phmap:
         logger.info("Saving results to pickle file")
         to_pickle(phmap, pp.fname_phmap)
 
@@ -119,25 +221,323 @@ def run_cgvt(pp):
     return phmap
 
 
+def run_cgvt_stream(pp, cache=None):
+    """
+    Run the CGVT processing one sequence at a time.
+
+    Each sequence is loaded, filtered, median-combined, ellipse-fitted,
+    registered and Zernike-fitted on its own, and its results are written
+    to a :class:`tigro.io.spool.Spool` in ``<outpath>/spool``, so peak
+    memory scales with one sequence instead of the whole campaign. The
+    outlier threshold and the reference frame depend on all sequences, so
+    the sequences are processed in three passes over the spool, and the
+    raw and filtered cubes are dropped as soon as they are no longer
+    needed. Sequences spooled by earlier runs that are not in
+    ``pp.sequence_ids`` are removed first.
+
+    Parameters
+    ----------
+    pp : tigro.classes.parser.Parser
+        Parsed configuration.
+    cache : tigro.io.cache.FrameCache, optional
+        Cache of decoded frames. Default is None.
+
+    Returns
+    -------
+    phmap : tigro.io.spool.Spool
+        Per-sequence results, readable as the in-memory ``phmap``.
+    uref : dict
+        Reference frame.
+    """
+    phmap = Spool(os.path.join(pp.outpath, "spool"))
+    # Sequences left over by earlier runs must not enter the threshold, the
+    # reference frame or the ZeroG analysis
+    sequence_ids = {int(sequence) for sequence in pp.sequence_ids}
+    for key in phmap:
+        if key not in sequence_ids:
+            logger.debug(f"Removing sequence {key} of a previous run from the spool")
+            del phmap[key]
+
+    # Same crop box for every sequence
+    crop = resolve_crop(
+        pp.datapath, pp.sequence_ids, pp.crop, margin=pp.crop_margin
+    )
+
+    for sequence in pp.sequence_ids:
+        logger.info(f"Loading and filtering sequence {sequence}")
+        _phmap = load_phmap(
+            pp.datapath,
+            [sequence],
+            down_sampling=pp.down_sampling,
+            n_workers=pp.n_workers,
+            as_cube=pp.load_cube,
+            memmap_dir=pp.outpath if pp.load_memmap else None,
+            dtype=pp.dtype,
+            cache=cache,
+            crop=crop,
+        )
+        _phmap = add_pyramids(_phmap, pp.pyramid_levels)
+        _phmap = filter_phmap(_phmap)
+        for item in _phmap.values():
+            item.pop("rawmap", None)
+        phmap.update(_phmap)
+
+    logger.info("Getting threshold for outlier rejection")
+    threshold = get_threshold(phmap, pp.phmap_threshold)
+
+    for sequence in pp.sequence_ids:
+        logger.info(f"Averaging, fitting ellipse and registering sequence {sequence}")
+        _phmap = {sequence: phmap[sequence]}
+        _phmap = med_phmap(
+            _phmap,
+            threshold,
+            filter_type=pp.phmap_filter_type,
+        )
+        _phmap = fit_ellipse(_phmap)
+        _phmap = register_phmap(_phmap)
+        for item in _phmap.values():
+            item.pop("cleanmap", None)
+        phmap.update(_phmap)
+
+    logger.info("Getting reference map")
+    uref = get_uref(
+        phmap,
+        pp.phmap_semi_major,
+        pp.phmap_semi_minor,
+        pp.phmap_seq_ref,
+    )
+
+    for sequence in pp.sequence_ids:
+        logger.info(f"Fitting Zernike orthonormal polynomials to sequence {sequence}")
+        phmap.update(
+            fit_zernike(
+                {sequence: phmap[sequence]},
+                uref,
+                NZernike=pp.n_zernike,
+            )
+        )
+
+    return phmap, uref
+
+
+def cgvt_stages(pp, cache=None):
+    """
+    Declare the checkpointed CGVT stages.
+
+    Each stage is keyed by the keys of the stages it depends on and by the
+    ``Parser`` fields it uses, and the loading stage by the identity of the
+    data files (see :class:`tigro.io.checkpoint.Checkpoints`), so a rerun
+    restores every unchanged stage from ``<outpath>/checkpoints``.
+
+    Parameters
+    ----------
+    pp : tigro.classes.parser.Parser
+        Parsed configuration.
+    cache : tigro.io.cache.FrameCache, optional
+        Cache of decoded frames. Default is None.
+
+    Returns
+    -------
+    dict
+        Lazily evaluated stages "load", "filter", "threshold", "median",
+        "ellipse", "register", "uref" and "zernike".
+    """
+    ckpt = Checkpoints(
+        os.path.join(pp.outpath, "checkpoints"), keep=pp.checkpoints_keep
+    )
+    stages = {}
+    crop = resolve_crop(
+        pp.datapath, pp.sequence_ids, pp.crop, margin=pp.crop_margin
+    )
+
+    stages["load"] = ckpt.stage(
+        "load",
+        lambda: add_pyramids(
+            load_phmap(
+                pp.datapath,
+                pp.sequence_ids,
+                down_sampling=pp.down_sampling,
+                n_workers=pp.n_workers,
+                as_cube=pp.load_cube,
+                dtype=pp.dtype,
+                cache=cache,
+                crop=crop,
+            ),
+            pp.pyramid_levels,
+        ),
+        files=hash_files(sequence_files(pp.datapath, pp.sequence_ids)),
+        sequence_ids=pp.sequence_ids,
+        down_sampling=pp.down_sampling,
+        crop=crop,
+        as_cube=pp.load_cube,
+        pyramid_levels=pp.pyramid_levels,
+        dtype=pp.dtype.str,
+    )
+    stages["filter"] = ckpt.stage(
+        "filter",
+        lambda: filter_phmap(stages["load"].value),
+        stages["load"],
+    )
+    stages["threshold"] = ckpt.stage(
+        "threshold",
+        lambda: get_threshold(stages["filter"].value, pp.phmap_threshold),
+        stages["filter"],
+        phmap_threshold=pp.phmap_threshold,
+    )
+    stages["median"] = ckpt.stage(
+        "median",
+        lambda: med_phmap(
+            stages["filter"].value,
+            stages["threshold"].value,
+            filter_type=pp.phmap_filter_type,
+        ),
+        stages["filter"],
+        stages["threshold"],
+        phmap_filter_type=pp._phmap_filter_type,
+    )
+    stages["ellipse"] = ckpt.stage(
+        "ellipse",
+        lambda: fit_ellipse(stages["median"].value),
+        stages["median"],
+    )
+    stages["register"] = ckpt.stage(
+        "register",
+        lambda: register_phmap(stages["ellipse"].value),
+        stages["ellipse"],
+    )
+    stages["uref"] = ckpt.stage(
+        "uref",
+        lambda: get_uref(
+            stages["register"].value,
+            pp.phmap_semi_major,
+            pp.phmap_semi_minor,
+            pp.phmap_seq_ref,
+        ),
+        stages["register"],
+        phmap_semi_major=pp.phmap_semi_major,
+        phmap_semi_minor=pp.phmap_semi_minor,
+        phmap_seq_ref=pp.phmap_seq_ref,
+    )
+    stages["zernike"] = ckpt.stage(
+        "zernike",
+        lambda: fit_zernike(
+            stages["register"].value,
+            stages["uref"].value,
+            NZernike=pp.n_zernike,
+        ),
+        stages["register"],
+        stages["uref"],
+        n_zernike=pp.n_zernike,
+    )
+
+    return stages
+
+
+def zerog_stages(pp, phmap=None):
+    """
+    Declare the checkpointed ZeroG stages.
+
+    Parameters
+    ----------
+    pp : tigro.classes.parser.Parser
+        Parsed configuration.
+    phmap : dict, optional
+        CGVT results of this run. If None, they are read from the spool
+        (streaming mode) or from the stored results (see
+        :func:`load_stored_phmap`), only if a stage has to be recomputed.
+
+    Returns
+    -------
+    dict
+        Lazily evaluated stages "zerog" and "delta".
+
+    Raises
+    ------
+    FileNotFoundError
+        If `phmap` is None and the stored CGVT results are missing.
+    """
+    ckpt = Checkpoints(
+        os.path.join(pp.outpath, "checkpoints"), keep=pp.checkpoints_keep
+    )
+    stages = {}
+
+    # The CGVT results are identified by their checkpoint key, or by the
+    # files they are stored in
+    if phmap and pp.checkpoints and not pp.stream_sequences:
+        source = cgvt_stages(pp)["zernike"].key
+    elif pp.stream_sequences:
+        spool = Spool(os.path.join(pp.outpath, "spool"))
+        source = hash_files(os.path.join(spool.path, f"{key}.pkl") for key in spool)
+        if not phmap:
+            phmap = spool
+    else:
+        source = hash_files(stored_phmap_files(pp))
+
+    stages["zerog"] = ckpt.stage(
+        "zerog",
+        lambda: zerog_phmap(
+            phmap if phmap else load_stored_phmap(pp),
+            get_diff_idx(pp.idx_gplus, pp.idx_gminus, pp.zerog_colors),
+        ),
+        source,
+        idx_gplus=pp._idx_gplus,
+        idx_gminus=pp._idx_gminus,
+        zerog_colors=pp._zerog_colors,
+    )
+    stages["delta"] = ckpt.stage(
+        "delta",
+        lambda: delta_phmap(
+            stages["zerog"].value[1],
+            idx0=pp.dphmap0_idx,
+            idx1=pp.dphmap1_idx,
+            gain=pp.dphmap_gain,
+            filter_type=pp.dphmap_filter_type,
+        ),
+        stages["zerog"],
+        dphmap0_idx=pp.dphmap0_idx,
+        dphmap1_idx=pp.dphmap1_idx,
+        dphmap_gain=pp.dphmap_gain,
+        dphmap_filter_type=pp._dphmap_filter_type,
+    )
+
+    return stages
+
+
 def run_zerog(pp, phmap=None):
     if not pp.run_zerog:
         return
 
     logger.info("Running ZeroG")
 
-    if not phmap:
+    stages = None
+    if pp.checkpoints:
+        try:
+            stages = zerog_stages(pp, phmap)
+        except FileNotFoundError:
+            logger.error("File not found")
+            return
+
+    if not phmap and pp.stream_sequences:
+        logger.info("Loading phase maps")
+        phmap = Spool(os.path.join(pp.outpath, "spool"))
+
+    if not phmap and stages is None:
         try:
             logger.info("Loading phase maps")
-            phmap = from_pickle(pp.fname_phmap)
+            phmap = load_stored_phmap(pp)
         except FileNotFoundError:
             logger.error("File not found")
             return
 
-    logger.info("Getting diff indices")
-    diff_idx = get_diff_idx(pp.idx_gplus, pp.idx_gminus, pp.zerog_colors)
+    if stages is not None:
+        logger.info("ZeroG-ing phase maps")
+        medmap, zerogmap, coeff_med, cmed, rms, color = stages["zerog"].value
+    else:
+        logger.info("Getting diff indices")
+        diff_idx = get_diff_idx(pp.idx_gplus, pp.idx_gminus, pp.zerog_colors)
 
-    logger.info("ZeroG-ing phase maps")
-    medmap, zerogmap, coeff_med, cmed, rms, color = zerog_phmap(phmap, diff_idx)
+        logger.info("ZeroG-ing phase maps")
+        medmap, zerogmap, coeff_med, cmed, rms, color = zerog_phmap(phmap, diff_idx)
 
     if pp.plot_zerog:
         logger.info("Plotting ZeroG results")
@@ -152,13 +552,16 @@ def run_zerog(pp, phmap=None):
         )
 
     logger.info("Computing delta phase map")
-    dphmap = delta_phmap(
-        zerogmap,
-        idx0=pp.dphmap0_idx,
-        idx1=pp.dphmap1_idx,
-        gain=pp.dphmap_gain,
-        filter_type=pp.dphmap_filter_type,
-    )
+    if stages is not None:
+        dphmap = stages["delta"].value
+    else:
+        dphmap = delta_phmap(
+            zerogmap,
+            idx0=pp.dphmap0_idx,
+            idx1=pp.dphmap1_idx,
+            gain=pp.dphmap_gain,
+            filter_type=pp.dphmap_filter_type,
+        )
 
     if pp.plot_dphmap:
         logger.info("Plotting delta phase map")
@@ -175,10 +578,19 @@ def run_zerog(pp, phmap=None):
     logger.info("ZeroG completed")
 
 
-def run(config, outpath):
+def run(config, outpath, n_workers=None, cache_dir=None, dtype=None):
     logger.info("Parsing configuration file")
     pp = Parser(config, outpath)
 
+    if n_workers is not None:
+        pp.n_workers = n_workers
+
+    if cache_dir is not None:
+        pp.cache_dir = cache_dir
+
+    if dtype is not None:
+        pp.dtype = np.dtype(dtype)
+
     logger.setLevel(pp.loglevel)
 
     phmap = run_cgvt(pp)
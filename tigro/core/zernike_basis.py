@@ -0,0 +1,124 @@
+import os
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from paos.classes.zernike import Zernike, PolyOrthoNorm
+
+from tigro.logging import logger
+
+_cache = OrderedDict()
+
+
+def _basis_key(uref, NZernike, orthonormalization, ordering, dtype):
+    return (
+        tuple(uref["pupil_mask"].shape),
+        round(float(uref["a"]), 6),
+        round(float(uref["b"]), 6),
+        round(float(uref.get("crop_factor", 0.0)), 6),
+        int(NZernike),
+        bool(orthonormalization),
+        ordering,
+        np.dtype(dtype).str,
+    )
+
+
+def _read_only(zkm):
+    # Flags set on zkm.data or zkm.mask would only apply to temporary
+    # views: wrap read-only views instead
+    data, mask = zkm.data, np.ma.getmaskarray(zkm)
+    data.flags.writeable = False
+    mask.flags.writeable = False
+    return np.ma.MaskedArray(data, mask=mask, fill_value=zkm.fill_value)
+
+
+def zernike_basis(
+    uref,
+    NZernike=15,
+    orthonormalization=True,
+    ordering="ansi",
+    cache_dir=None,
+    maxsize=4,
+    dtype=np.float64,
+):
+    """
+    Evaluate a Zernike basis on the common reference frame, with caching.
+
+    The polynomials are computed on the ``polar_rho``/``polar_phi`` grid of
+    the reference frame returned by
+    :func:`tigro.utils.common_reference_frame.common_reference_frame`,
+    optionally orthonormalized over its pupil. Bases are cached in memory
+    (LRU) and, if `cache_dir` is given, on disk as ``.npz`` files, keyed by
+    the reference frame geometry ``(shape, a, b, crop_factor)`` and by the
+    basis options, so reruns that leave them unchanged reuse the basis.
+
+    Parameters
+    ----------
+    uref : dict
+        Reference frame, as returned by ``common_reference_frame``.
+    NZernike : int, optional
+        Number of polynomials (default: 15).
+    orthonormalization : bool, optional
+        If True (default), the polynomials are orthonormalized over the
+        pupil (:class:`paos.classes.zernike.PolyOrthoNorm`); otherwise plain
+        normalized Zernike polynomials are returned.
+    ordering : str, optional
+        Polynomial ordering passed to PAOS (default: "ansi").
+    cache_dir : str, optional
+        Directory of the on-disk cache. Default is None (memory only).
+    maxsize : int, optional
+        Number of bases kept in the in-memory cache (default: 4).
+    dtype : data-type, optional
+        Data type of the returned basis (default: ``np.float64``). The
+        polynomials are always evaluated in double precision.
+
+    Returns
+    -------
+    zkm : numpy.ma.MaskedArray
+        Basis of shape (NZernike, Ny, Nx). The array is shared with the
+        cache and therefore read-only; copy it before modifying it.
+    """
+    key = _basis_key(uref, NZernike, orthonormalization, ordering, dtype)
+
+    if key in _cache:
+        _cache.move_to_end(key)
+        logger.debug("Zernike basis found in memory cache")
+        return _cache[key]
+
+    path = None
+    if cache_dir is not None:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        path = os.path.join(os.path.expanduser(cache_dir), f"zernike_{digest}.npz")
+
+    if path is not None and os.path.exists(path):
+        logger.debug(f"Zernike basis read from {path}")
+        with np.load(path) as npz:
+            data = npz["data"]
+            mask = np.unpackbits(npz["mask"], axis=-1, count=data.shape[-1])
+        zkm = np.ma.MaskedArray(data, mask=mask.astype(bool), fill_value=0.0)
+    else:
+        logger.info(f"Computing {NZernike} Zernike polynomials")
+        rho = uref["polar_rho"].copy()
+        phi = uref["polar_phi"].copy()
+        if orthonormalization:
+            poly = PolyOrthoNorm(NZernike, rho, phi, ordering=ordering, normalize=True)
+        else:
+            poly = Zernike(NZernike, rho, phi, ordering=ordering, normalize=True)
+        zkm = poly()
+        zkm = np.ma.MaskedArray(
+            zkm.data.astype(dtype, copy=False),
+            mask=np.ma.getmaskarray(zkm),
+            fill_value=0.0,
+        )
+
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", "wb") as fs:
+                np.savez(fs, data=zkm.data, mask=np.packbits(zkm.mask, axis=-1))
+            os.replace(f"{path}.tmp", path)
+
+    zkm = _read_only(zkm)
+    _cache[key] = zkm
+    while len(_cache) > maxsize:
+        _cache.popitem(last=False)
+
+    return zkm
@@ -1,4 +1,19 @@
 from .load import load_phmap, sort_phmap
 from .get_processed_sequence import get_processed_sequence
+from .cache import FrameCache
+from .spool import Spool
+from .catalogue import Catalogue, get_catalogue
+from .processed import ProcessedSequence, save_processed_sequence, phmap_to_h5
 
-__all__ = ["load_phmap", "sort_phmap", "get_processed_sequence"]
+__all__ = [
+    "load_phmap",
+    "sort_phmap",
+    "get_processed_sequence",
+    "FrameCache",
+    "Spool",
+    "Catalogue",
+    "get_catalogue",
+    "ProcessedSequence",
+    "save_processed_sequence",
+    "phmap_to_h5",
+]
@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+from tigro.logging import logger
+
+
+class FrameCache:
+    """
+    Persistent on-disk cache of decoded phase maps.
+
+    Each measurement file is stored as one ``.npz`` archive holding its
+    decoded, wavelength-scaled float64 surfaces (NaN outside the pupil), their
+    bit-packed masks and the per-frame metadata. Entries are keyed by the
+    absolute path, modification time and size of the source file, so an
+    edited or replaced file is decoded again.
+
+    The cache is bounded in size with a least-recently-used eviction
+    policy: the modification time of an entry is refreshed on every hit
+    and the oldest entries are removed once ``max_size`` is exceeded.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory holding the cache entries. Created if missing.
+    max_size : float, optional
+        Maximum total size of the cache, in bytes (default: 10 GB).
+    compress : bool, optional
+        If True, entries are written with :func:`numpy.savez_compressed`.
+        Default is False, which favours read speed.
+
+    Notes
+    -----
+    Instances only hold plain attributes, so they can be passed to the
+    worker processes used by :func:`tigro.io.load.load_phmap`. Writes are
+    atomic, so concurrent workers never read a partial entry.
+    """
+
+    version = 2
+
+    def __init__(self, cache_dir, max_size=10e9, compress=False):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size = max_size
+        self.compress = compress
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, fname):
+        """
+        Return the cache key of a measurement file.
+
+        Parameters
+        ----------
+        fname : str
+            Path to the measurement file.
+
+        Returns
+        -------
+        str
+            Hex digest of the file path, modification time and size.
+        """
+        stat = os.stat(fname)
+        token = f"{self.version}:{os.path.abspath(fname)}:{stat.st_mtime_ns}:{stat.st_size}"
+        return hashlib.sha1(token.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, fname):
+        """
+        Look up the decoded frames of a measurement file.
+
+        Parameters
+        ----------
+        fname : str
+            Path to the measurement file.
+
+        Returns
+        -------
+        list of tuple or None
+            ``(number, data, meta)`` for every frame, as returned by the
+            decoder, or None on a cache miss.
+        """
+        path = self._path(self.key(fname))
+        try:
+            with np.load(path) as npz:
+                data = npz["data"]
+                mask = np.unpackbits(
+                    npz["mask"], axis=-1, count=data.shape[-1]
+                ).astype(bool)
+                numbers = npz["numbers"].tolist()
+                if npz["int_numbers"]:
+                    numbers = [int(number) for number in numbers]
+                metas = json.loads(str(npz["meta"]))
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+
+        os.utime(path)
+        logger.debug(f"Cache hit for {os.path.basename(fname)}")
+
+        return [
+            (
+                number,
+                np.ma.masked_array(data=data[i], mask=mask[i], fill_value=0.0),
+                meta,
+            )
+            for i, (number, meta) in enumerate(zip(numbers, metas))
+        ]
+
+    def put(self, fname, frames):
+        """
+        Store the decoded frames of a measurement file.
+
+        Parameters
+        ----------
+        fname : str
+            Path to the measurement file.
+        frames : list of tuple
+            ``(number, data, meta)`` for every frame, where ``data`` is a
+            masked array. All frames must share the same shape.
+        """
+        if not frames:
+            return
+
+        numbers, data, metas = zip(*frames)
+        save = np.savez_compressed if self.compress else np.savez
+
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fs:
+                save(
+                    fs,
+                    data=np.stack([np.ma.getdata(d) for d in data]),
+                    mask=np.packbits(
+                        np.stack([np.ma.getmaskarray(d) for d in data]), axis=-1
+                    ),
+                    numbers=np.array([str(number) for number in numbers]),
+                    int_numbers=all(isinstance(number, int) for number in numbers),
+                    meta=json.dumps(metas),
+                )
+            os.replace(tmp, self._path(self.key(fname)))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until within ``max_size``."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.debug(f"Evicted {os.path.basename(path)} from cache")
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                os.remove(entry.path)
@@ -0,0 +1,285 @@
+import os
+import json
+import tempfile
+import h5py
+
+from tigro.logging import logger
+
+# Mode of a file created with open(), since mkstemp creates 0600 files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_FILE_MODE = 0o666 & ~_UMASK
+
+
+def _parse_name(fname):
+    # Sequence and measurement number of a "<sequence>_<number>_..." file
+    basename, fextension = os.path.splitext(fname)
+    sequence, *rest = basename.split("_")
+    try:
+        sequence = int(sequence)
+    except ValueError:
+        return None
+    number = rest[0] if rest else ""
+    try:
+        number = int(number)
+    except ValueError:
+        number = ""
+    return sequence, number, basename, fextension
+
+
+def _inspect_4d(full_path_name):
+    # Wavelength, first timestamp and number of measurements of a .4D file
+    with h5py.File(full_path_name, "r") as fs:
+        group = fs["Measurement"]
+        if "NumOfMeasurements" in group.attrs.keys():
+            keys = [key for key in group.keys() if "Measurement" in key]
+            count = len(keys)
+            group = group[keys[0]] if keys else None
+        else:
+            count = 1
+        if group is None:
+            return None, None, int(count)
+        wavelength = float(group.attrs["WavelengthInNanometers"])
+        timestamp = group["Metadata"].attrs["Timestamp"]
+        if isinstance(timestamp, bytes):
+            timestamp = timestamp.decode("ascii")
+    # Plain types, so that the entry can be written as JSON
+    return wavelength, str(timestamp), int(count)
+
+
+class Catalogue:
+    """
+    Persistent index of the ``<sequence>_<number>_...`` files of a directory.
+
+    Every file whose name starts with an integer sequence number is
+    indexed with its sequence, measurement number, extension, size and
+    modification time. ``.4D`` files also record their wavelength, the
+    timestamp of their first measurement and their number of measurements.
+    Lookups by sequence are dict lookups and do not touch the directory.
+
+    The index is stored as JSON in ``<dir_path>/.tigro_catalogue.json``.
+    It is considered fresh while the directory has not been modified since
+    it was written, which costs two ``stat`` calls instead of a listing.
+    Otherwise the directory is rescanned, reusing the entries of files
+    whose size and modification time are unchanged, and the index is
+    rewritten, readable by the other users of the directory as allowed by
+    the umask. If the directory is read-only, the index is kept in memory
+    only.
+
+    Parameters
+    ----------
+    dir_path : str
+        Directory to index.
+
+    Notes
+    -----
+    Overwriting a file in place does not change the directory modification
+    time; call :meth:`refresh` with ``force=True`` to pick up such edits.
+    The same applies to files added within the same modification time tick
+    as the last scan, which can happen on file systems with coarse
+    timestamps (e.g. some NAS mounts with 1 s or 2 s resolution). Files
+    that cannot be inspected are indexed without wavelength, timestamp
+    and count, and a warning is logged.
+    Use :func:`get_catalogue` to share one catalogue per directory within a
+    process.
+    """
+
+    version = 1
+    index_name = ".tigro_catalogue.json"
+
+    def __init__(self, dir_path):
+        self.dir_path = os.path.expanduser(dir_path)
+        self.fname = os.path.join(self.dir_path, self.index_name)
+        self._entries = {}
+        self._by_sequence = {}
+        self._dir_mtime = None
+
+        try:
+            with open(self.fname, "r") as fs:
+                index = json.load(fs)
+            if index.get("version") == self.version:
+                self._set_entries(index["files"])
+                self._dir_mtime = index["dir_mtime_ns"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        self.refresh()
+
+    def _set_entries(self, entries):
+        self._entries = entries
+        self._by_sequence = {}
+        for name in sorted(entries):
+            entry = entries[name]
+            # Paths are not stored, so the directory can be moved
+            entry["path"] = os.path.join(self.dir_path, name)
+            self._by_sequence.setdefault(entry["sequence"], []).append(entry)
+
+    def _is_fresh(self):
+        if self._dir_mtime is None:
+            return False
+        return os.stat(self.dir_path).st_mtime_ns <= self._dir_mtime
+
+    def refresh(self, force=False):
+        """
+        Rescan the directory if it changed since the index was built.
+
+        Parameters
+        ----------
+        force : bool, optional
+            If True, rescan even if the directory looks unchanged, and
+            check the size and modification time of every file. Default is
+            False.
+
+        Returns
+        -------
+        bool
+            True if the directory was rescanned.
+        """
+        if not force and self._is_fresh():
+            return False
+
+        start_mtime = os.stat(self.dir_path).st_mtime_ns
+        entries = {}
+        inspected = 0
+        for item in os.scandir(self.dir_path):
+            if not item.is_file() or item.name == self.index_name:
+                continue
+            parsed = _parse_name(item.name)
+            if parsed is None:
+                continue
+            sequence, number, basename, fextension = parsed
+            stat = item.stat()
+
+            entry = self._entries.get(item.name)
+            if (
+                entry is not None
+                and entry["mtime_ns"] == stat.st_mtime_ns
+                and entry["size"] == stat.st_size
+            ):
+                entries[item.name] = entry
+                continue
+
+            entry = {
+                "name": basename,
+                "sequence": sequence,
+                "number": number,
+                "extension": fextension,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "wavelength": None,
+                "timestamp": None,
+                "count": 1,
+            }
+            if fextension == ".4D":
+                try:
+                    wavelength, timestamp, count = _inspect_4d(item.path)
+                    entry.update(wavelength=wavelength, timestamp=timestamp, count=count)
+                except Exception as e:
+                    # One unusual file must not prevent indexing the others
+                    logger.warning(f"Could not inspect {item.name}: {e!r}")
+            entries[item.name] = entry
+            inspected += 1
+
+        self._set_entries(entries)
+        self._dir_mtime = start_mtime
+        logger.debug(
+            f"Indexed {len(entries)} files in {self.dir_path} ({inspected} new or modified)"
+        )
+        self._save()
+        return True
+
+    def _save(self):
+        index = {
+            "version": self.version,
+            "dir_mtime_ns": self._dir_mtime,
+            "files": {
+                name: {key: value for key, value in entry.items() if key != "path"}
+                for name, entry in self._entries.items()
+            },
+        }
+        # Files added during the scan must still trigger the next rescan
+        unchanged = os.stat(self.dir_path).st_mtime_ns == self._dir_mtime
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.dir_path, suffix=".tmp")
+        except OSError:
+            logger.debug(f"{self.dir_path} is read-only, keeping the catalogue in memory")
+            return
+        try:
+            with os.fdopen(fd, "w") as fs:
+                json.dump(index, fs)
+            # The index is shared by every user of the directory
+            os.chmod(tmp, _FILE_MODE)
+            os.replace(tmp, self.fname)
+            # Writing the index modifies the directory itself
+            mtime = os.stat(self.dir_path).st_mtime_ns
+            if unchanged and mtime > self._dir_mtime:
+                self._dir_mtime = mtime
+                index["dir_mtime_ns"] = mtime
+                with open(self.fname, "w") as fs:
+                    json.dump(index, fs)
+        except OSError as e:
+            logger.debug(f"Could not write the catalogue of {self.dir_path}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def files(self, sequence, extensions=None):
+        """
+        Return the entries of a sequence.
+
+        Parameters
+        ----------
+        sequence : int
+            Sequence number.
+        extensions : iterable of str, optional
+            Extensions to keep, e.g. ``(".dat", ".4D")``. Default is None,
+            which keeps every file.
+
+        Returns
+        -------
+        list of dict
+            Entries sorted by file name, with keys "path", "name",
+            "sequence", "number", "extension", "mtime_ns", "size",
+            "wavelength", "timestamp" and "count".
+        """
+        entries = self._by_sequence.get(int(sequence), [])
+        if extensions is not None:
+            entries = [entry for entry in entries if entry["extension"] in extensions]
+        return entries
+
+    def sequences(self):
+        """Sorted list of the indexed sequences."""
+        return sorted(self._by_sequence)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.dir_path!r}, files={len(self)})"
+
+
+_catalogues = {}
+
+
+def get_catalogue(dir_path):
+    """
+    Return the catalogue of a directory, shared within the process.
+
+    The catalogue is refreshed if the directory changed since the last
+    call.
+
+    Parameters
+    ----------
+    dir_path : str
+        Directory to index.
+
+    Returns
+    -------
+    Catalogue
+    """
+    dir_path = os.path.abspath(os.path.expanduser(dir_path))
+    catalogue = _catalogues.get(dir_path)
+    if catalogue is None:
+        catalogue = _catalogues[dir_path] = Catalogue(dir_path)
+    else:
+        catalogue.refresh()
+    return catalogue
@@ -0,0 +1,246 @@
+import os
+import re
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+
+from tigro.io.catalogue import get_catalogue
+from tigro.logging import logger
+
+
+def _token(value):
+    # Stable text representation of a stage parameter
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return f"ndarray({value.dtype.str}, {value.shape}, {digest})"
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}({', '.join(_token(v) for v in value)})"
+    if isinstance(value, dict):
+        return f"dict({', '.join(f'{k!r}: {_token(v)}' for k, v in sorted(value.items()))})"
+    return repr(value)
+
+
+def hash_files(paths):
+    """
+    Hash the identity of a set of files.
+
+    Parameters
+    ----------
+    paths : iterable of str
+        File paths.
+
+    Returns
+    -------
+    str
+        Hex digest of the sorted absolute paths, modification times and
+        sizes of the files, so that editing, replacing, adding or removing
+        a file changes it.
+    """
+    sha = hashlib.sha1()
+    for path in sorted(os.path.abspath(path) for path in paths):
+        stat = os.stat(path)
+        sha.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}\n".encode())
+    return sha.hexdigest()
+
+
+def sequence_files(dir_path, sequence_ids):
+    """
+    List the measurement files of the requested sequences.
+
+    Parameters
+    ----------
+    dir_path : str
+        Directory containing the measurement files, named
+        ``<sequence>_<number>_...`` as expected by
+        :func:`tigro.io.load.load_phmap`.
+    sequence_ids : array_like of int
+        Sequences to list.
+
+    Returns
+    -------
+    list of str
+        Sorted file paths.
+    """
+    allowed_extensions = ".h5", ".dat", ".4D"
+    catalogue = get_catalogue(dir_path)
+    return sorted(
+        entry["path"]
+        for sequence in sequence_ids
+        for entry in catalogue.files(sequence, extensions=allowed_extensions)
+    )
+
+
+class Stage:
+    """
+    Lazily evaluated pipeline stage, see :meth:`Checkpoints.stage`.
+
+    Attributes
+    ----------
+    name : str
+        Stage name.
+    key : str
+        Content address of the stage result.
+    """
+
+    def __init__(self, store, name, key, func):
+        self.store = store
+        self.name = name
+        self.key = key
+        self._func = func
+        self._value = None
+        self._done = False
+
+    @property
+    def cached(self):
+        """True if the result is available in the store."""
+        return os.path.exists(self.store._fname(self.name, self.key))
+
+    @property
+    def value(self):
+        """Result of the stage, restored from the store or computed."""
+        if not self._done:
+            if self.cached:
+                logger.info(f"Restoring stage '{self.name}' from checkpoint")
+                self._value = self.store._load(self.name, self.key)
+            else:
+                self._value = self._func()
+                self.store._save(self.name, self.key, self._value)
+            self._done = True
+            self._func = None
+        return self._value
+
+
+class Checkpoints:
+    """
+    Content-addressed store of pipeline stage results.
+
+    Every stage result is pickled to ``<path>/<name>_<key>.pkl``. The key
+    is a hash of the stage name, of the keys of the stages it depends on
+    and of its own parameters (e.g. the relevant ``Parser`` fields or a
+    hash of the input files), so it changes whenever anything upstream
+    changes. A rerun therefore reuses every stage whose inputs are
+    unchanged and recomputes the others: changing ``n_zernike`` only
+    recomputes the Zernike fit and what follows.
+
+    Stages are evaluated lazily: the result of a stage is only restored
+    (or computed) when its :attr:`Stage.value` is accessed, so the
+    intermediates upstream of a restored stage are not even read.
+
+    Artifacts hold whole intermediate ``phmap`` dicts, so only the `keep`
+    most recently used keys of every stage are retained: saving a new
+    result of a stage removes its older artifacts.
+
+    Parameters
+    ----------
+    path : str
+        Directory holding the artifacts. Created if missing.
+    keep : int, optional
+        Number of artifacts retained per stage (default: 1). Use more to
+        switch back and forth between configurations without recomputing.
+
+    Examples
+    --------
+    >>> ckpt = Checkpoints(os.path.join(outpath, "checkpoints"))
+    >>> load = ckpt.stage("load", lambda: load_phmap(datapath, ids), files=digest)
+    >>> filt = ckpt.stage("filter", lambda: filter_phmap(load.value), load)
+    >>> phmap = filt.value
+    """
+
+    version = 1
+
+    def __init__(self, path, keep=1):
+        self.path = os.path.expanduser(path)
+        self.keep = max(int(keep), 1)
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, name, *parents, **params):
+        """
+        Return the content address of a stage.
+
+        Parameters
+        ----------
+        name : str
+            Stage name.
+        *parents : Stage or str
+            Upstream stages, or their keys.
+        **params
+            Parameters the stage result depends on.
+
+        Returns
+        -------
+        str
+            Hex digest.
+        """
+        parents = [getattr(parent, "key", parent) for parent in parents]
+        token = f"{self.version}:{name}:{parents}:{_token(params)}"
+        return hashlib.sha1(token.encode()).hexdigest()
+
+    def stage(self, name, func, *parents, **params):
+        """
+        Declare a stage.
+
+        Parameters
+        ----------
+        name : str
+            Stage name, e.g. "filter".
+        func : callable
+            Function without arguments computing the stage result,
+            typically a lambda reading the ``value`` of its parents.
+        *parents : Stage or str
+            Upstream stages, or their keys.
+        **params
+            Parameters the stage result depends on.
+
+        Returns
+        -------
+        Stage
+            Lazily evaluated stage.
+        """
+        return Stage(self, name, self.key(name, *parents, **params), func)
+
+    def _fname(self, name, key):
+        return os.path.join(self.path, f"{name}_{key}.pkl")
+
+    def _load(self, name, key):
+        fname = self._fname(name, key)
+        with open(fname, "rb") as fs:
+            value = pickle.load(fs)
+        # Mark the artifact as recently used for the retention policy
+        os.utime(fname)
+        return value
+
+    def _save(self, name, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fs:
+                pickle.dump(value, fs, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._fname(name, key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        logger.debug(f"Stage '{name}' checkpointed as {key}")
+        self._prune(name)
+
+    def _prune(self, name):
+        # Remove all but the `keep` most recently used artifacts of a stage
+        pattern = re.compile(rf"{re.escape(name)}_[0-9a-f]{{40}}\.pkl")
+        entries = sorted(
+            (
+                entry
+                for entry in os.scandir(self.path)
+                if pattern.fullmatch(entry.name)
+            ),
+            key=lambda entry: entry.stat().st_mtime_ns,
+            reverse=True,
+        )
+        for entry in entries[self.keep :]:
+            logger.debug(f"Removing superseded checkpoint {entry.name}")
+            os.remove(entry.path)
+
+    def clear(self):
+        """Remove every artifact from the store."""
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".pkl"):
+                os.remove(entry.path)
@@ -1,7 +1,9 @@
 import numpy as np
-import pickle, glob, os
+import pickle
 import h5py
 
+from tigro.io.catalogue import get_catalogue
+
 
 def load_recursively_from_h5(group, metadata):
     for key, item in group.items():
@@ -12,45 +14,67 @@ def load_recursively_from_h5(group, metadata):
             load_recursively_from_h5(item, metadata[key])
 
 
+def find_processed_sequence(sequence, path, SN=None, ext=".pkl"):
+    """
+    Find the processed file of a sequence.
+
+    Files are looked up in the :class:`tigro.io.catalogue.Catalogue` of
+    the directory, which is only rescanned when the directory changes.
+
+    Parameters
+    ----------
+    sequence : int
+        Sequence to find.
+    path : str
+        Directory holding the ``<sequence>_...`` files.
+    SN : str, optional
+        Tag the file name must contain. Default is None.
+    ext : str, optional
+        File extension (default: ".pkl").
+
+    Returns
+    -------
+    str
+        Path to the file.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the sequence is not found.
+    """
+    catalogue = get_catalogue(path)
+    for entry in catalogue.files(sequence, extensions=(ext,)):
+        if not SN or SN in entry["name"]:
+            return entry["path"]
+    raise FileNotFoundError("Sequence not found.")
+
+
 def get_processed_sequence(
     sequence,
     path,
     SN=None,
     ext=".pkl",
 ):
-    if SN:
-        full_path = os.path.expanduser(os.path.join(path, "*{:s}*{}".format(SN, ext)))
+    fname = find_processed_sequence(sequence, path, SN=SN, ext=ext)
+
+    if ext == ".pkl":
+        with open(fname, "rb") as fs:
+            _map, _map_ptt, _map_pttf, _map_residual, _metadata = pickle.load(fs)
+
+    elif ext == ".h5":
+        with h5py.File(fname, "r") as fs:
+            _data = {}
+            load_recursively_from_h5(fs["data"], _data)
+            _map, _map_ptt, _map_pttf, _map_residual = (
+                np.ma.masked_invalid(_data["regmap"]),
+                np.ma.masked_invalid(_data["regmap_ptt"]),
+                np.ma.masked_invalid(_data["regmap_pttf"]),
+                np.ma.masked_invalid(_data["regmap_residual"]),
+            )
+            _metadata = {}
+            load_recursively_from_h5(fs["metadata"], _metadata)
+
     else:
-        full_path = os.path.expanduser(os.path.join(path, "*{}".format(ext)))
-
-    all_files = glob.glob(full_path)
-
-    for fname in all_files:
-        basename, fext = os.path.splitext(os.path.basename(fname))
-        seq = basename.split("_")[0]
-        seq = int(seq)
-        if seq != sequence:
-            continue
-
-        if ext == ".pkl":
-            with open(fname, "rb") as fs:
-                _map, _map_ptt, _map_pttf, _map_residual, _metadata = pickle.load(fs)
-
-        elif ext == ".h5":
-            with h5py.File(fname, "r") as fs:
-                _data = {}
-                load_recursively_from_h5(fs["data"], _data)
-                _map, _map_ptt, _map_pttf, _map_residual = (
-                    np.ma.masked_invalid(_data["regmap"]),
-                    np.ma.masked_invalid(_data["regmap_ptt"]),
-                    np.ma.masked_invalid(_data["regmap_pttf"]),
-                    np.ma.masked_invalid(_data["regmap_residual"]),
-                )
-                _metadata = {}
-                load_recursively_from_h5(fs["metadata"], _metadata)
-
-        else:
-            raise ValueError("Unsupported file extension: {:s}".format(ext))
-
-        return _map, _map_ptt, _map_pttf, _map_residual, _metadata
-    raise FileNotFoundError("Sequence not found.")
+        raise ValueError("Unsupported file extension: {:s}".format(ext))
+
+    return _map, _map_ptt, _map_pttf, _map_residual, _metadata
@@ -1,103 +1,494 @@
 import numpy as np
 import pandas as pd
 from prysm.interferogram import Interferogram
-import os, glob, h5py
+import os, h5py
+from concurrent.futures import ProcessPoolExecutor
+from time import time as timer
+from tigro.classes.frame_cube import FrameCube
+from tigro.utils.pyramid import build_pyramid
+from tigro.io.catalogue import get_catalogue
 from tigro.logging import logger
 
 
-def load_phmap(dir_path, sequence_ids, down_sampling=None):
-    allowed_extensions = ".h5", ".dat", ".4D"
-    namelist = []
+def _list_numbers(number, fextension, full_path_name):
+    """
+    List the measurement numbers stored in a file without decoding it.
+
+    Parameters
+    ----------
+    number : int or str
+        Measurement number parsed from the file name.
+    fextension : str
+        File extension.
+    full_path_name : str
+        Path to the file.
+
+    Returns
+    -------
+    list
+        Measurement numbers, with the same types used as keys by
+        :func:`load_phmap`.
+    """
+    if fextension == ".dat":
+        return [int(number)]
+    elif fextension == ".4D":
+        with h5py.File(full_path_name, "r") as fs:
+            if "NumOfMeasurements" in fs["Measurement"].attrs.keys():
+                return [
+                    key.split("_")[1]
+                    for key in fs["Measurement"].keys()
+                    if "Measurement" in key
+                ]
+        return [int(number)]
+    return []
+
+
+def _region(crop=None, down_sampling=None):
+    # Row and column selections of a crop box and a stride
+    y0, y1, x0, x1 = crop if crop is not None else (None,) * 4
+    step = down_sampling or None
+    return slice(y0, y1, step), slice(x0, x1, step)
+
+
+def _read_region(dataset, region, dtype):
+    """
+    Read a strided region of a 2D HDF5 dataset.
+
+    The selection is passed to HDF5 as a hyperslab, so only the selected
+    rows and columns are read and converted, straight into an array of
+    the requested type.
+
+    Parameters
+    ----------
+    dataset : h5py.Dataset
+        2D dataset.
+    region : tuple of slice
+        Row and column selections.
+    dtype : data-type
+        Data type of the returned array.
+
+    Returns
+    -------
+    numpy.ndarray
+        Selected region.
+    """
+    shape = tuple(
+        len(range(*sel.indices(size))) for sel, size in zip(region, dataset.shape)
+    )
+    out = np.empty(shape, dtype=dtype)
+    if out.size:
+        dataset.read_direct(out, source_sel=region)
+    return out
+
+
+def _4d_measurements(fs, number):
+    """
+    Iterate over the measurements of an open ``.4D`` file.
+
+    Parameters
+    ----------
+    fs : h5py.File
+        Open ``.4D`` file.
+    number : int or str
+        Measurement number parsed from the file name, used for files
+        holding a single measurement.
+
+    Yields
+    ------
+    number : int or str
+        Measurement number.
+    group : h5py.Group
+        Measurement group, holding ``SurfaceInWaves/Data`` and
+        ``Metadata``.
+    """
+    if "NumOfMeasurements" in fs["Measurement"].attrs.keys():
+        for key, item in fs["Measurement"].items():
+            if "Measurement" not in key:
+                continue
+            _, number = key.split("_")
+            yield number, item
+    else:
+        yield int(number), fs["Measurement"]
+
 
-    for fextension in allowed_extensions:
-        namelist = namelist + glob.glob(
-            os.path.expanduser(os.path.join(dir_path, "*" + fextension))
+def pupil_bbox(full_path_name, margin=0):
+    """
+    Bounding box of the valid pixels of the first frame of a file.
+
+    Parameters
+    ----------
+    full_path_name : str
+        Path to a ``.dat`` or ``.4D`` file.
+    margin : int, optional
+        Pixels added on every side of the box, e.g. to tolerate pupil
+        motion between frames (default: 0).
+
+    Returns
+    -------
+    tuple of int
+        ``(y0, y1, x0, x1)``, to be used as ``data[y0:y1, x0:x1]``.
+    """
+    fextension = os.path.splitext(full_path_name)[1]
+    if fextension == ".4D":
+        with h5py.File(full_path_name, "r") as fs:
+            _, group = next(_4d_measurements(fs, 0))
+            dataset = group["SurfaceInWaves"]["Data"]
+            data = _read_region(dataset, _region(), dataset.dtype)
+    else:
+        data = Interferogram.from_zygo_dat(full_path_name).data
+
+    rows = np.flatnonzero(np.isfinite(data).any(axis=1))
+    cols = np.flatnonzero(np.isfinite(data).any(axis=0))
+    if rows.size == 0:
+        return 0, data.shape[0], 0, data.shape[1]
+    return (
+        max(int(rows[0]) - margin, 0),
+        min(int(rows[-1]) + 1 + margin, data.shape[0]),
+        max(int(cols[0]) - margin, 0),
+        min(int(cols[-1]) + 1 + margin, data.shape[1]),
+    )
+
+
+def resolve_crop(dir_path, sequence_ids, crop, margin=0):
+    """
+    Turn a crop specification into a ``(y0, y1, x0, x1)`` box.
+
+    Resolving "pupil" once and passing the box to every
+    :func:`load_phmap` call keeps the same shape across sequences loaded
+    separately.
+
+    Parameters
+    ----------
+    dir_path : str
+        Directory containing the measurement files.
+    sequence_ids : array_like of int
+        Requested sequences.
+    crop : {"pupil"} or tuple of int or None
+        Crop specification. "pupil" is the bounding box of the valid
+        pixels of the first frame of the first requested sequence.
+    margin : int, optional
+        Pixels added around the pupil bounding box (default: 0).
+
+    Returns
+    -------
+    tuple of int or None
+        Crop box, or None if `crop` is None or no file is found.
+    """
+    if crop is None:
+        return None
+    if isinstance(crop, str) and crop == "pupil":
+        catalogue = get_catalogue(dir_path)
+        for sequence in sequence_ids:
+            entries = catalogue.files(sequence, extensions=(".dat", ".4D"))
+            if entries:
+                crop = pupil_bbox(entries[0]["path"], margin=margin)
+                logger.info(f"Cropping maps to the pupil bounding box {crop}")
+                return crop
+        return None
+    return tuple(int(edge) for edge in crop)
+
+
+def _decode_phmap_file(
+    number,
+    name,
+    fextension,
+    full_path_name,
+    dtype=np.float64,
+    down_sampling=None,
+    crop=None,
+):
+    """
+    Decode the frames of a single measurement file.
+
+    ``.4D`` surfaces are read lazily: only the rows and columns selected
+    by `crop` and `down_sampling` are read from the file.
+
+    Parameters
+    ----------
+    number : int or str
+        Measurement number parsed from the file name.
+    name : str
+        File name without extension.
+    fextension : str
+        File extension.
+    full_path_name : str
+        Path to the file.
+    dtype : data-type, optional
+        Data type of the decoded surfaces (default: ``np.float64``).
+    down_sampling : int, optional
+        Stride applied along both axes. Default is None.
+    crop : tuple of int, optional
+        ``(y0, y1, x0, x1)`` box to read, e.g. from :func:`pupil_bbox`.
+        Default is None, which reads the full frame.
+
+    Returns
+    -------
+    list of tuple
+        ``(number, data, meta)`` for every measurement found in the file,
+        where ``data`` is a masked array with NaNs masked.
+    """
+    frames = []
+    region = _region(crop, down_sampling)
+
+    if fextension == ".dat":
+        number = int(number)
+        ima = Interferogram.from_zygo_dat(full_path_name)
+        data = np.array(ima.data[region], dtype=dtype)
+        data = np.ma.masked_array(data=data, mask=np.isnan(data), fill_value=0.0)
+        frames.append((number, data, {"name": name}))
+    elif fextension == ".4D":
+        with h5py.File(full_path_name, "r") as fs:
+            for number, group in _4d_measurements(fs, number):
+                wav = group.attrs["WavelengthInNanometers"]
+                data = _read_region(
+                    group["SurfaceInWaves"]["Data"],
+                    # group['UnprocessedUnwrappedPhase']['Data'],
+                    region,
+                    dtype,
+                )
+                data *= wav
+                data = np.ma.masked_array(
+                    data=data, mask=np.isnan(data), fill_value=0.0
+                )
+                meta = {
+                    "name": name,
+                    "Timestamp": group["Metadata"].attrs["Timestamp"].decode("ascii"),
+                }
+                frames.append((number, data, meta))
+
+    return frames
+
+
+def _read_phmap_file(task):
+    """
+    Read a single interferometric measurement file.
+
+    Runs in the calling process for serial loading and in a worker process
+    when :func:`load_phmap` is called with ``n_workers > 1``, so it only
+    takes and returns picklable objects. Frames are taken from the cache
+    when available, otherwise decoded and stored in it. Without a cache,
+    only the selected region is read from the file.
+
+    Parameters
+    ----------
+    task : tuple
+        ``(number, name, fextension, full_path_name, down_sampling, crop,
+        dtype, cache)`` as assembled by :func:`load_phmap`.
+
+    Returns
+    -------
+    frames : list of tuple
+        ``(number, data, meta)`` for every measurement found in the file,
+        where ``data`` is a masked array with NaNs masked.
+    elapsed : float
+        Wall-clock time spent reading the file, in seconds.
+    """
+    number, name, fextension, full_path_name, down_sampling, crop, dtype, cache = task
+    start = timer()
+
+    if cache is None:
+        frames = _decode_phmap_file(
+            number,
+            name,
+            fextension,
+            full_path_name,
+            dtype=dtype,
+            down_sampling=down_sampling,
+            crop=crop,
+        )
+        return frames, timer() - start
+
+    # The cache holds full float64 frames, so that any region and precision
+    # can be served from it
+    frames = cache.get(full_path_name)
+    if frames is None:
+        frames = _decode_phmap_file(
+            number, name, fextension, full_path_name, dtype=np.float64
         )
+        cache.put(full_path_name, frames)
+    # Copy the region, so that the frames do not keep the whole cached
+    # arrays alive
+    region = _region(crop, down_sampling)
+    frames = [
+        (number, np.ma.array(data[region], dtype=dtype, copy=True), meta)
+        for number, data, meta in frames
+    ]
 
-    namelist = sorted(namelist)
-    list_of_sequences = []
-    for fname in namelist:
-        basename, fextension = os.path.splitext(os.path.basename(fname))
+    return frames, timer() - start
 
-        sequence, number, *_ = basename.split("_")
-        sequence = int(sequence)
-        try:
-            number = int(number)
-        except ValueError:
-            number = ""
 
-        list_of_sequences.append([sequence, number, basename, fextension, fname])
+def load_phmap(
+    dir_path,
+    sequence_ids,
+    down_sampling=None,
+    n_workers=None,
+    as_cube=False,
+    memmap_dir=None,
+    dtype=np.float64,
+    cache=None,
+    crop=None,
+    crop_margin=0,
+):
+    """
+    Load the phase maps of the requested sequences from a data directory.
 
+    Files are named ``<sequence>_<number>_...`` with extension ``.dat``
+    (Zygo) or ``.4D`` (4D Technology HDF5, possibly holding several
+    measurements). Surfaces are converted to nanometers and returned as
+    masked arrays with NaNs masked. Files are looked up in the
+    :class:`tigro.io.catalogue.Catalogue` of the directory.
+
+    Parameters
+    ----------
+    dir_path : str
+        Directory containing the measurement files.
+    sequence_ids : array_like of int
+        Sequences to load.
+    down_sampling : int, optional
+        Stride applied along both axes of every map. Default is None.
+    n_workers : int, optional
+        Number of worker processes used to decode files concurrently. If None
+        or 1 (default), files are decoded serially in the calling process.
+        Results are merged in the same order as the serial path, so the
+        output does not depend on this setting.
+    as_cube : bool, optional
+        If True, the frames of each sequence are written straight into a
+        preallocated :class:`tigro.classes.frame_cube.FrameCube`, sorted by
+        measurement number, instead of a dict of masked arrays.
+        Default is False.
+    memmap_dir : str, optional
+        If given together with ``as_cube``, the cubes are backed by
+        ``<sequence>_rawmap.npy`` memory maps in this directory.
+    dtype : data-type, optional
+        Data type of the loaded maps, and of the cubes when ``as_cube`` is
+        True (default: ``np.float64``). ``np.float32`` halves the memory
+        footprint of the pipeline.
+    cache : tigro.io.cache.FrameCache, optional
+        Persistent cache of decoded frames. Files found in the cache are not
+        decoded again. Default is None.
+    crop : {"pupil"} or tuple of int, optional
+        Region of every map to load, as ``(y0, y1, x0, x1)``. If "pupil",
+        the bounding box of the valid pixels of the first frame of the
+        first requested sequence is used (see :func:`pupil_bbox`), so all
+        the maps keep the same shape. Together with `down_sampling`, the
+        region is read from ``.4D`` files as an HDF5 hyperslab, so cropped
+        or decimated loads read proportionally less data. Default is None,
+        which loads the full maps.
+    crop_margin : int, optional
+        Pixels added around the pupil bounding box when `crop` is "pupil"
+        (default: 0).
+
+    Returns
+    -------
+    retval : dict
+        ``retval[sequence][number]`` is the masked phase map, or
+        ``retval[sequence]`` is a ``FrameCube`` if ``as_cube`` is True.
+    metadata : dict
+        ``metadata[sequence][number]`` holds the file name and, for ``.4D``
+        files, the measurement timestamp.
+    """
+    allowed_extensions = ".h5", ".dat", ".4D"
+    catalogue = get_catalogue(dir_path)
+    sequence_files = [
+        [
+            entry["sequence"],
+            entry["number"],
+            entry["name"],
+            entry["extension"],
+            entry["path"],
+        ]
+        for sid in sequence_ids
+        for entry in catalogue.files(sid, extensions=allowed_extensions)
+    ]
+    crop = resolve_crop(dir_path, sequence_ids, crop, margin=crop_margin)
+    tasks = [
+        (number, name, fextension, full_path_name, down_sampling, crop, dtype, cache)
+        for _, number, name, fextension, full_path_name in sequence_files
+    ]
+
+    numbers = {}
+    if as_cube:
+        for sequence, number, _, fextension, full_path_name in sequence_files:
+            numbers.setdefault(sequence, []).extend(
+                _list_numbers(number, fextension, full_path_name)
+            )
+        numbers = {seq: sorted(nums, key=int) for seq, nums in numbers.items()}
+
+    if n_workers is not None and n_workers > 1:
+        logger.info(f"Reading {len(tasks)} files with {n_workers} workers")
+        executor = ProcessPoolExecutor(max_workers=n_workers)
+        results = executor.map(_read_phmap_file, tasks)
+    else:
+        executor = None
+        results = map(_read_phmap_file, tasks)
+
+    start = timer()
     retval = {}
     metadata = {}
-    for seq in sequence_ids:
-        sequence_files = [x for x in list_of_sequences if x[0] == seq]
-
+    try:
         for seq in sequence_files:
-            sequence, number, name, fextension, full_path_name = seq
-            logger.info("Reading {:s}".format(name))
+            sequence, name = seq[0], seq[2]
+            if executor is None:
+                logger.info("Reading {:s}".format(name))
+            frames, elapsed = next(results)
+            logger.debug(f"Read {name} in {elapsed:.2f} s")
 
             if not sequence in retval:
                 retval[sequence] = {}
                 metadata[sequence] = {}
 
-            if fextension == ".dat":
-                number = int(number)
-                ima = Interferogram.from_zygo_dat(full_path_name)
-                data = np.array(ima.data)
-                data = np.ma.masked_array(
-                    data=data, mask=np.isnan(data), fill_value=0.0
-                )
-                if down_sampling:
-                    data = data[::down_sampling, ::down_sampling]
-                retval[sequence][number] = data
-                metadata[sequence][number] = {"name": name}
-            elif fextension == ".4D":
-                with h5py.File(full_path_name, "r") as fs:
-                    if "NumOfMeasurements" in fs["Measurement"].attrs.keys():
-                        Nmeas = fs["Measurement"].attrs["NumOfMeasurements"]
-                        for key, item in fs["Measurement"].items():
-                            if "Measurement" not in key:
-                                continue
-                            _, number = key.split("_")
-                            wav = fs["Measurement"][key].attrs["WavelengthInNanometers"]
-                            data = (
-                                np.array(
-                                    fs["Measurement"][key]["SurfaceInWaves"]["Data"],
-                                    # fs['Measurement'][key]['UnprocessedUnwrappedPhase']['Data'],
-                                    dtype=np.float64,
-                                ) * wav
-                            )
-                            if down_sampling:
-                                data = data[::down_sampling, ::down_sampling]
-                            retval[sequence][number] = np.ma.masked_array(
-                                data=data, mask=np.isnan(data), fill_value=0.0
-                            )
-                            metadata[sequence][number] = {"name": name,
-                                                          "Timestamp" : fs["Measurement"][key]["Metadata"].attrs["Timestamp"].decode('ascii')}
-                    else:
-                        number = int(number)
-                        wav = fs["Measurement"].attrs["WavelengthInNanometers"]
-                        data = (
-                            np.array(
-                                fs["Measurement"]["SurfaceInWaves"]["Data"],
-                                # fs['Measurement'][key]['UnprocessedUnwrappedPhase']['Data'],
-                                dtype=np.float64,
-                            )
-                            * wav
+            for number, data, meta in frames:
+                if as_cube:
+                    if not isinstance(retval[sequence], FrameCube):
+                        path = None
+                        if memmap_dir is not None:
+                            path = os.path.join(memmap_dir, f"{sequence}_rawmap")
+                        retval[sequence] = FrameCube(
+                            numbers[sequence], data.shape, dtype=dtype, path=path
                         )
-                        if down_sampling:
-                            data = data[::down_sampling, ::down_sampling]
-                        retval[sequence][number] = np.ma.masked_array(
-                            data=data, mask=np.isnan(data), fill_value=0.0
-                        )
-                        metadata[sequence][number] = {"name": name,
-                                                      "Timestamp" : fs["Measurement"][key]["Metadata"].attrs["Timestamp"].decode('ascii')}
+                    retval[sequence].set_frame(number, data)
+                else:
+                    retval[sequence][number] = data
+                metadata[sequence][number] = meta
+    finally:
+        # On error, do not wait for the queued files to be decoded
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    for _data in retval.values():
+        if isinstance(_data, FrameCube):
+            _data.flush()
+
+    logger.info(f"Read {len(tasks)} files in {timer() - start:.2f} s")
 
     return retval, metadata
 
 
-def sort_phmap(data, meta):
+def sort_phmap(data, meta, pyramid_levels=None):
+    """
+    Stack the phase maps of each sequence sorted by measurement number.
+
+    Parameters
+    ----------
+    data : dict
+        Phase maps, as returned by :func:`load_phmap`.
+    meta : dict
+        Metadata, as returned by :func:`load_phmap`.
+    pyramid_levels : iterable of int, optional
+        Downsampling factors of the quick-look pyramid built for each
+        sequence with :func:`tigro.utils.pyramid.build_pyramid`, e.g.
+        ``(2, 4, 8)``. Default is None, which keeps the pyramid built by
+        :func:`tigro.utils.pyramid.add_pyramids`, if any.
+
+    Returns
+    -------
+    retval : dict
+        ``retval[sequence]`` is the (N, Ny, Nx) masked stack.
+    metadata : dict
+        ``metadata[sequence]`` holds the sorted ``numbers``, ``names``,
+        ``timestamp`` and ``phi_offs`` of the sequence and, if available,
+        its ``pyramid``.
+    """
     retval = {}
     metadata = {}
 
@@ -105,8 +496,12 @@ def sort_phmap(data, meta):
         _data = data[sequence]
         _meta = meta[sequence]
 
-        numbers = sorted([num for num in _data.keys()], key=int)
-        rawmap = np.ma.stack([_data[num] for num in numbers])
+        if isinstance(_data, FrameCube):
+            numbers = _data.numbers
+            rawmap = _data.to_masked()
+        else:
+            numbers = sorted([num for num in _data.keys()], key=int)
+            rawmap = np.ma.stack([_data[num] for num in numbers])
         timestamps = pd.to_datetime([_meta[num]['Timestamp'] for num in numbers], utc=True)
         names = [_meta[num]["name"] for num in numbers]
         retval[sequence] = rawmap
@@ -125,4 +520,9 @@ def sort_phmap(data, meta):
 
         metadata[sequence] = {"numbers": numbers, "names": names, "phi_offs": phi_offs, "timestamp" : timestamps}
 
+        if pyramid_levels:
+            metadata[sequence]["pyramid"] = build_pyramid(rawmap, pyramid_levels)
+        elif "pyramid" in _meta:
+            metadata[sequence]["pyramid"] = _meta["pyramid"]
+
     return retval, metadata
@@ -0,0 +1,331 @@
+import os
+import numpy as np
+import h5py
+
+from tigro.classes.frame_cube import FrameCube
+from tigro.core.fit_polynomial import PolynomialModel
+from tigro.io.get_processed_sequence import (
+    find_processed_sequence,
+    load_recursively_from_h5,
+)
+from tigro.logging import logger
+
+# Datasets of the processed-sequence layout and the phmap keys they hold
+PHMAP_H5_KEYS = {
+    "regmap": "RegMap",
+    "regmap_ptt": "RegMap-PTT",
+    "regmap_pttf": "RegMap-PTTF",
+    "regmap_residual": "residual",
+}
+
+
+def save_recursively_to_h5(group, metadata):
+    """
+    Write a nested dict to an HDF5 group, one dataset per leaf.
+
+    Strings, numbers, arrays and sequences of them are stored as datasets,
+    dicts as subgroups, and timestamps as ISO 8601 strings. Polynomial
+    models (:class:`tigro.core.fit_polynomial.PolynomialModel`, or lists
+    of them) are stored as their coefficients. Other values are skipped
+    with a debug message.
+
+    Parameters
+    ----------
+    group : h5py.Group
+        Destination group.
+    metadata : dict
+        Nested dict to write.
+    """
+    for key, item in metadata.items():
+        key = str(key)
+        if isinstance(item, dict):
+            save_recursively_to_h5(group.create_group(key), item)
+            continue
+
+        if isinstance(item, PolynomialModel):
+            item = item.coeff
+        elif (
+            isinstance(item, (list, tuple))
+            and item
+            and all(isinstance(model, PolynomialModel) for model in item)
+        ):
+            item = np.stack([model.coeff for model in item])
+
+        if hasattr(item, "isoformat"):
+            item = item.isoformat()
+        elif hasattr(item, "strftime") and hasattr(item, "__len__"):
+            item = [t.isoformat() for t in item]
+        if isinstance(item, np.ma.MaskedArray):
+            item = item.filled(np.nan) if item.dtype.kind == "f" else item.data
+
+        try:
+            value = np.asarray(item)
+            if value.dtype.kind == "U":
+                value = value.astype(h5py.string_dtype())
+            elif value.dtype.kind == "O":
+                raise TypeError
+            group.create_dataset(key, data=value)
+        except (TypeError, ValueError):
+            logger.debug(f"Skipping metadata {key} of type {type(item).__name__}")
+
+
+def save_processed_sequence(
+    fname, data, metadata=None, compression="gzip", compression_opts=4
+):
+    """
+    Write the processed maps of a sequence with the ``.h5`` layout read by
+    :func:`tigro.io.get_processed_sequence.get_processed_sequence`.
+
+    Cubes are stored under ``data/<name>`` with masked pixels set to NaN,
+    one chunk per frame, so a single frame can be read and decompressed
+    without touching the others. Metadata are stored under ``metadata``
+    with :func:`save_recursively_to_h5`.
+
+    Parameters
+    ----------
+    fname : str
+        Output file, named ``<sequence>_...h5`` so it can be found by
+        sequence.
+    data : dict
+        ``data[name]`` is a (N, Ny, Nx) masked cube, e.g. ``regmap``,
+        ``regmap_ptt``, ``regmap_pttf`` and ``regmap_residual``.
+    metadata : dict, optional
+        Nested metadata. Default is None.
+    compression : {"gzip", "lzf", None}, optional
+        HDF5 compression filter (default: "gzip"). "lzf" is faster to
+        write and read at a lower compression ratio.
+    compression_opts : int, optional
+        Compression level for "gzip" (default: 4).
+    """
+    if compression != "gzip":
+        compression_opts = None
+
+    tmp = f"{fname}.tmp"
+    with h5py.File(tmp, "w") as fs:
+        group = fs.create_group("data")
+        for name, cube in data.items():
+            if isinstance(cube, FrameCube):
+                cube = cube.to_masked()
+            cube = np.ma.asarray(cube)
+            values = cube.filled(np.nan) if cube.dtype.kind == "f" else cube.data
+            group.create_dataset(
+                name,
+                data=values,
+                chunks=(1,) + values.shape[1:] if values.ndim == 3 else True,
+                compression=compression,
+                compression_opts=compression_opts,
+                shuffle=compression is not None,
+            )
+        save_recursively_to_h5(fs.create_group("metadata"), metadata or {})
+    os.replace(tmp, fname)
+
+
+def phmap_to_h5(phmap, path, SN="tigro", compression="gzip"):
+    """
+    Write every sequence of a ``phmap`` to its own processed-sequence file.
+
+    Sequences are written one at a time to ``<path>/<sequence>_<SN>.h5``,
+    so a spooled ``phmap`` (:class:`tigro.io.spool.Spool`) is never fully
+    loaded. The cubes listed in ``PHMAP_H5_KEYS`` go to ``data`` under
+    their layout name, other cubes (e.g. ``rawmap`` and ``cleanmap``) to
+    ``data`` under their own key, and every other item of the sequence to
+    ``metadata``. Polynomial models are stored as their coefficients.
+
+    Parameters
+    ----------
+    phmap : mapping
+        Processed phase maps, ``phmap[sequence][key]``.
+    path : str
+        Output directory.
+    SN : str, optional
+        Tag included in the file names (default: "tigro").
+    compression : {"gzip", "lzf", None}, optional
+        HDF5 compression filter (default: "gzip").
+
+    Returns
+    -------
+    list of str
+        Written files.
+    """
+    fnames = []
+    for sequence, item in phmap.items():
+        names = {key: name for name, key in PHMAP_H5_KEYS.items()}
+        data, metadata = {}, {}
+        for key, value in item.items():
+            if key in names:
+                data[names[key]] = value
+            elif isinstance(value, FrameCube) or (
+                isinstance(value, np.ndarray) and value.ndim == 3
+            ):
+                data[key] = value
+            else:
+                metadata[key] = value
+
+        fname = os.path.join(path, f"{sequence}_{SN}.h5")
+        logger.info(f"Writing sequence {sequence} to {fname}")
+        save_processed_sequence(fname, data, metadata, compression=compression)
+        fnames.append(fname)
+
+    return fnames
+
+
+def _decode_strings(value):
+    # h5py returns strings as bytes
+    if isinstance(value, dict):
+        return {key: _decode_strings(item) for key, item in value.items()}
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, np.ndarray) and value.dtype.kind in "OS":
+        return [_decode_strings(item) for item in value.tolist()]
+    return value
+
+
+def h5_to_phmap(path, sequence_ids, SN="tigro"):
+    """
+    Read back the sequences written by :func:`phmap_to_h5`.
+
+    Parameters
+    ----------
+    path : str
+        Directory holding the ``<sequence>_<SN>.h5`` files.
+    sequence_ids : array_like of int
+        Sequences to read.
+    SN : str, optional
+        Tag included in the file names (default: "tigro").
+
+    Returns
+    -------
+    dict
+        ``phmap[sequence][key]``, with the cubes as masked arrays (NaN
+        masked) under their ``phmap`` keys and the metadata items at the
+        top level. Polynomial models are returned as their coefficients.
+
+    Raises
+    ------
+    FileNotFoundError
+        If a sequence is not found.
+    """
+    keys = dict(PHMAP_H5_KEYS)
+    phmap = {}
+    for sequence in sequence_ids:
+        sequence = int(sequence)
+        with ProcessedSequence.find(sequence, path, SN=SN) as seq:
+            item = _decode_strings(seq.metadata)
+            for name in seq.keys():
+                item[keys.get(name, name)] = seq[name][:]
+        phmap[sequence] = item
+    return phmap
+
+
+class _LazyCube:
+    # Masked view of a dataset, read on indexing
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    @property
+    def shape(self):
+        return self.dataset.shape
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        return np.ma.masked_invalid(self.dataset[idx])
+
+
+class ProcessedSequence:
+    """
+    Lazy reader of a processed-sequence ``.h5`` file.
+
+    Nothing is read when the file is opened: ``seq["regmap"]`` returns a
+    lazy cube whose indexing (``seq["regmap"][3]``) reads and decompresses
+    only the requested frames, and metadata are only read when first
+    accessed.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the file.
+
+    Examples
+    --------
+    >>> with ProcessedSequence.find(273, path) as seq:
+    ...     frame = seq.frame("regmap", 0)
+    ...     cube = seq["regmap_pttf"][:]
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self._fs = h5py.File(fname, "r")
+        self._metadata = None
+
+    @classmethod
+    def find(cls, sequence, path, SN=None):
+        """
+        Open the processed file of a sequence in a directory.
+
+        Parameters
+        ----------
+        sequence : int
+            Sequence to open.
+        path : str
+            Directory holding the ``<sequence>_...h5`` files.
+        SN : str, optional
+            Tag the file name must contain. Default is None.
+
+        Returns
+        -------
+        ProcessedSequence
+
+        Raises
+        ------
+        FileNotFoundError
+            If the sequence is not found.
+        """
+        return cls(find_processed_sequence(sequence, path, SN=SN, ext=".h5"))
+
+    def keys(self):
+        """Names of the stored cubes."""
+        return list(self._fs["data"].keys())
+
+    def __getitem__(self, name):
+        return _LazyCube(self._fs["data"][name])
+
+    def frame(self, name, index):
+        """
+        Read a single frame.
+
+        Parameters
+        ----------
+        name : str
+            Cube name, e.g. "regmap".
+        index : int
+            Frame index.
+
+        Returns
+        -------
+        numpy.ma.MaskedArray
+            Frame, masked where NaN.
+        """
+        return self[name][index]
+
+    @property
+    def metadata(self):
+        """Nested metadata dict, read on first access."""
+        if self._metadata is None:
+            self._metadata = {}
+            load_recursively_from_h5(self._fs["metadata"], self._metadata)
+        return self._metadata
+
+    def close(self):
+        self._fs.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
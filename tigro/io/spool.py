@@ -0,0 +1,114 @@
+import os
+import numbers
+import pickle
+import tempfile
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from tigro.logging import logger
+
+
+class Spool(MutableMapping):
+    """
+    Dict-like store of per-sequence results backed by pickle files.
+
+    Every item is written to ``<path>/<key>.pkl`` on assignment and read
+    back on access; only the last item accessed is kept in memory. Code
+    written for the in-memory ``phmap`` dict (``phmap[seq]["RegMap"]``,
+    iteration over the sequences, ``phmap.items()``) works unchanged, while
+    only the sequences being accessed are loaded.
+
+    Parameters
+    ----------
+    path : str
+        Directory holding the items. Created if missing. Items already
+        present are picked up, so a spool can be reopened.
+    cache_items : int, optional
+        Number of recently accessed items kept in memory (default: 1), so
+        that repeated lookups of the same sequence, e.g.
+        ``phmap[seq]["coeff"]`` then ``phmap[seq]["residual"]``, read it
+        once.
+
+    Notes
+    -----
+    ``spool[seq]["medmap"] = ...`` is not written to disk: it is only seen
+    while the item is cached. Reassign the whole item instead
+    (``spool[seq] = item``). Writes are atomic.
+
+    Examples
+    --------
+    >>> phmap = Spool(os.path.join(outpath, "spool"))
+    >>> for seq in sequence_ids:
+    ...     phmap.update(filter_phmap({seq: phmap[seq]}))
+    """
+
+    def __init__(self, path, cache_items=1):
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.cache_items = cache_items
+        self._cache = OrderedDict()
+
+        self._keys = []
+        for name in sorted(os.listdir(self.path)):
+            key, ext = os.path.splitext(name)
+            if ext == ".pkl":
+                self._keys.append(int(key) if key.lstrip("-").isdigit() else key)
+
+    def _fname(self, key):
+        return os.path.join(self.path, f"{key}.pkl")
+
+    def _remember(self, key, value):
+        # Least recently used items are dropped first
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_items:
+            self._cache.popitem(last=False)
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key in self._cache:
+            value = self._cache[key]
+        else:
+            with open(self._fname(key), "rb") as fs:
+                value = pickle.load(fs)
+        self._remember(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        if isinstance(key, numbers.Integral):
+            key = int(key)
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fs:
+                pickle.dump(value, fs, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._fname(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        if key not in self._keys:
+            self._keys.append(key)
+        self._remember(key, value)
+        logger.debug(f"Spooled {key} to {self.path}")
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        os.remove(self._fname(key))
+        self._keys.remove(key)
+        self._cache.pop(key, None)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path!r}, keys={self._keys})"
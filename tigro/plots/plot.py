@@ -5,6 +5,8 @@ from matplotlib.gridspec import GridSpec
 from matplotlib.colorbar import Colorbar
 from matplotlib.patches import Ellipse
 
+from tigro.utils.pyramid import downsample
+
 
 figsize = (8, 8 / 1.618)
 
@@ -33,16 +35,23 @@ def plot_sag_quicklook(
     imkey,
     imsubkey="rawmap",
     outpath=None,
+    level=None,
 ):
-    nkeys = len(phmap[imkey][imsubkey])
+    maps = phmap[imkey][imsubkey]
+    if level is not None and level > 1:
+        # Coarse level of the load-time pyramid, if available
+        pyramid = phmap[imkey].get("pyramid", {}) if imsubkey == "rawmap" else {}
+        maps = pyramid[level] if level in pyramid else downsample(maps, level)
+
+    nkeys = len(maps)
     ncols = 6
     nrows = int(np.ceil(nkeys / ncols))
     fig = plt.figure(figsize=(3 * ncols, 3 * nrows))
 
     vmin, vmax = [], []
     for i in range(nkeys):
-        vmin = np.min(phmap[imkey][imsubkey][i])
-        vmax = np.max(phmap[imkey][imsubkey][i])
+        vmin = np.min(maps[i])
+        vmax = np.max(maps[i])
     vmin = np.median(vmin) - 3 * np.std(vmin)
     vmax = np.median(vmax) + 3 * np.std(vmax)
 
@@ -50,7 +59,7 @@ def plot_sag_quicklook(
         ax = fig.add_subplot(nrows, ncols, i + 1)
         if i < nkeys:
             im = ax.imshow(
-                phmap[imkey][imsubkey][i],
+                maps[i],
                 origin="lower",
                 interpolation="none",
                 zorder=0,
@@ -88,10 +97,13 @@ def plot_sag(
     vmin=None,
     vmax=None,
 ):
+    # Read the item once, phmap may be a tigro.io.spool.Spool
+    item = phmap[imkey]
+
     fig = plt.figure(111, figsize=figsize)
     ax = fig.add_subplot(111)
     img = ax.imshow(
-        phmap[imkey][imsubkey],
+        item[imsubkey],
         origin="lower",
         interpolation="none",
         extent=uref["extent"],
@@ -125,7 +137,7 @@ def plot_sag(
     ax.set_ylim(-1.1, 1.1)
 
     bar.set_label("Sag [nm]")
-    figname = phmap[imkey]["name"][0].split("_")
+    figname = item["name"][0].split("_")
     figname = "_".join([figname[0]] + figname[2:])
     ax.set_title(f"{figname}", fontsize=14)
     ax.legend(loc=1, fontsize=10)
@@ -158,17 +170,21 @@ def plot_allpolys(
     ax0 = plt.subplot(gs[0:4, 0:3])
     ax1 = plt.subplot(gs[0:4, 3:])
 
+    # Read every item once, phmap may be a tigro.io.spool.Spool
+    coeff_ref = phmap[sequence_ref]["coeff"]
+
     ipol = np.arange(5, NZernike + 1)
     for k, seq in enumerate(sequence_ids):
+        item = phmap[seq]
         ax0.plot(
             ipol + k / separator / 2,
-            phmap[seq]["coeff"][4:] - phmap[sequence_ref]["coeff"][4:],
+            item["coeff"][4:] - coeff_ref[4:],
             "." + colors[k],
             markersize=5,
         )
         ax1.plot(
             seq,
-            phmap[seq]["residual"].std(),
+            item["residual"].std(),
             "." + colors[k],
             markersize=5,
         )
@@ -211,10 +227,13 @@ def plot_polys(
 ):
     fig, ax0 = plt.subplots(1, 1, figsize=figsize)
 
+    # Read every item once, phmap may be a tigro.io.spool.Spool
+    coeff_ref = phmap[sequence_ref]["coeff"]
+
     for seq, k in itertools.product(sequence_ids, poly_order):
         ax0.plot(
             seq,
-            phmap[seq]["coeff"][k - 1] - phmap[sequence_ref]["coeff"][k - 1],
+            phmap[seq]["coeff"][k - 1] - coeff_ref[k - 1],
             "." + colors[poly_order.index(k)],
             markersize=10,
         )
@@ -3,7 +3,6 @@ import shutil
 from tigro import __pkg_name__
 from tigro import __version__
 from tigro import logger
-# from tigro.core.run import run
 
 
 def main():
@@ -54,6 +53,35 @@ def main():
         help="Enable logging to file",
     )
 
+    parser.add_argument(
+        "-n",
+        "--n-workers",
+        dest="n_workers",
+        type=int,
+        default=None,
+        required=False,
+        help="Number of processes used to load the phase maps (overrides the configuration file)",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        type=str,
+        default=None,
+        required=False,
+        help="Directory of the decoded phase map cache (overrides the configuration file)",
+    )
+
+    parser.add_argument(
+        "--dtype",
+        dest="dtype",
+        type=str,
+        choices=["float32", "float64"],
+        default=None,
+        required=False,
+        help="Floating point precision of the phase maps (overrides the configuration file)",
+    )
+
     args = parser.parse_args()
 
     logger.info(f"Configuration file: {args.config}")
@@ -75,7 +103,17 @@ def main():
         addLogFile(fname=logfile, reset=True, level=logger.level)
         logger.info("Logging to file enabled")
 
-    # run(args.config, args.outpath)
+    # Imported here, so that the pipeline dependencies are not needed to
+    # parse the arguments or print the help
+    from tigro.core.run import run
+
+    run(
+        args.config,
+        args.outpath,
+        n_workers=args.n_workers,
+        cache_dir=args.cache_dir,
+        dtype=args.dtype,
+    )
 
     end = timer()
     logger.info(f"Finished in {end - start:.2f} seconds")
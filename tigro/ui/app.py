@@ -1,5 +1,8 @@
 import os
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import matplotlib.pyplot as plt
 import mpld3
@@ -19,7 +22,8 @@ from tigro import __version__
 from tigro import __license__
 
 from tigro.classes.parser import Parser
-from tigro.io.load import load_phmap
+from tigro.io.load import load_phmap, resolve_crop
+from tigro.io.cache import FrameCache
 from tigro.core.process import filter_phmap
 from tigro.utils.util import get_threshold
 from tigro.core.process import med_phmap
@@ -31,6 +35,7 @@ from tigro.core.fit import fit_zernike
 from tigro.io.save import to_pickle
 from tigro.io.load import from_pickle
 from tigro.utils.util import get_diff_idx
+from tigro.utils.pyramid import add_pyramids
 from tigro.core.process import zerog_phmap
 from tigro.core.process import delta_phmap
 
@@ -140,6 +145,42 @@ def app_ui(request: StarletteRequest) -> Tag:
     )
 
 
+def load_sequence(pp, sequence_id, crop=None, cache=None):
+    """
+    Load a sequence and build its quick-look pyramid.
+
+    Runs in a worker thread of the UI load step.
+
+    Parameters
+    ----------
+    pp : tigro.classes.parser.Parser
+        Configuration.
+    sequence_id : int
+        Sequence to load.
+    crop : tuple of int, optional
+        Crop box, resolved once for all the sequences with
+        :func:`tigro.io.load.resolve_crop`. Default is None.
+    cache : tigro.io.cache.FrameCache, optional
+        Persistent cache of decoded frames. Default is None.
+
+    Returns
+    -------
+    retval, metadata : dict
+        As returned by :func:`tigro.io.load.load_phmap`, with
+        ``metadata[sequence_id]["pyramid"]`` if pyramid levels are
+        configured.
+    """
+    retval = load_phmap(
+        pp.datapath,
+        [sequence_id],
+        down_sampling=pp.down_sampling,
+        dtype=pp.dtype,
+        cache=cache,
+        crop=crop,
+    )
+    return add_pyramids(retval, pp.pyramid_levels)
+
+
 def server(input, output, session):
     config = reactive.value("config")
     pp = reactive.value({})
@@ -157,6 +198,10 @@ def server(input, output, session):
     figure_zerog = reactive.value(None)
     dphmap = reactive.value(None)
     figure_dphmap = reactive.value(None)
+    loading = reactive.value(False)
+    last_run_all_cgvt = reactive.value(None)
+    resume_cgvt = reactive.value(None)
+    load_tasks = set()
 
     def full_refresh():
         req(pp.get())
@@ -192,29 +237,80 @@ def server(input, output, session):
     def _load_phmap_():
         req(pp.get())
 
-        sequence_ids = pp.get().sequence_ids
-        for seq in sequence_ids:
-            if seq not in phmap.get().keys():
-                logger.debug("phmap not found: loading")
-                break
-        else:
-            logger.debug("phmap already loaded: skipping")
-            return
+        # The other CGVT steps wait for the load to complete, then resume
+        resume = input.run_all_cgvt() != (last_run_all_cgvt.get() or 0)
+        last_run_all_cgvt.set(input.run_all_cgvt())
 
-        with ui.Progress(min=0, max=len(sequence_ids)) as p:
-            p.set(message="Loading sequences", detail="")
-            time.sleep(0.5)
+        if loading.get():
+            logger.debug("phmap already loading: skipping")
+            return
 
-            # phmap = load_phmap(pp.get().datapath, sequence_ids)
-            retval = {}
-            for i, sequence_id in enumerate(sequence_ids):
+        sequence_ids = [
+            seq for seq in pp.get().sequence_ids if seq not in phmap.get().keys()
+        ]
+        if not sequence_ids:
+            logger.debug("phmap already loaded: skipping")
+            return
+        logger.debug("phmap not found: loading")
+
+        loading.set(True)
+        # Keep a reference, or the task can be garbage-collected while running
+        task = asyncio.create_task(_load_phmap_task(pp.get(), sequence_ids, resume))
+        load_tasks.add(task)
+        task.add_done_callback(load_tasks.discard)
+
+    async def _load_phmap_task(_pp, sequence_ids, resume):
+        loop = asyncio.get_running_loop()
+        p = ui.Progress(min=0, max=len(sequence_ids), session=session)
+        p.set(message="Loading sequences", detail="")
+
+        cache = None
+        if _pp.cache_dir is not None:
+            cache = FrameCache(_pp.cache_dir, max_size=_pp.cache_size * 1e9)
+
+        # Sequences are loaded concurrently, so the next ones are being read
+        # while the first ones are already shown
+        executor = ThreadPoolExecutor(max_workers=max(_pp.n_workers, 2))
+        try:
+            crop = await loop.run_in_executor(
+                executor,
+                partial(
+                    resolve_crop,
+                    _pp.datapath,
+                    _pp.sequence_ids,
+                    _pp.crop,
+                    margin=_pp.crop_margin,
+                ),
+            )
+            futures = [
+                loop.run_in_executor(
+                    executor, load_sequence, _pp, sequence_id, crop, cache
+                )
+                for sequence_id in sequence_ids
+            ]
+            for i, (sequence_id, future) in enumerate(zip(sequence_ids, futures)):
                 p.set(i, message=f"Loading sequence {sequence_id}", detail="")
-                retval.update(load_phmap(pp.get().datapath, [sequence_id]))
+                retval = await future
 
-            phmap.set(retval)
+                async with reactive.lock():
+                    with reactive.isolate():
+                        phmap.set({**phmap.get(), **retval})
+                    await reactive.flush()
 
             p.set(len(sequence_ids), message="Done!", detail="")
-            time.sleep(0.5)
+        except Exception as e:
+            logger.error(f"Loading failed: {e}")
+            ui.notification_show(f"Loading failed: {e}", type="error", session=session)
+            resume = False
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            p.close()
+            async with reactive.lock():
+                loading.set(False)
+                if resume:
+                    with reactive.isolate():
+                        resume_cgvt.set((resume_cgvt.get() or 0) + 1)
+                await reactive.flush()
 
     def save_generic(save_func, *args):
         with ui.Progress(min=0, max=15) as p:
@@ -272,12 +368,16 @@ def server(input, output, session):
     def plot_1_system():
         req(pp.get())
         req(phmap.get())
+        # Sequences become available one at a time while loading
+        req(int(input.select_1_system()) in phmap.get())
         generic_plot(
             figure_quicklook,
             plot_sag_quicklook,
             phmap.get(),
             int(input.select_1_system()),
             "rawmap",
+            None,
+            int(input.select_2_system()),
         )
 
     @reactive.effect
@@ -295,9 +395,10 @@ def server(input, output, session):
         save_generic_plot(figure_quicklook, outfile)
 
     @reactive.effect(priority=-1)
-    @reactive.event(input.run_all_cgvt, input.run_step2_cgvt)
+    @reactive.event(input.run_all_cgvt, input.run_step2_cgvt, resume_cgvt)
     def _filter_phmap_():
         req(pp.get())
+        req(not loading.get())
         req(phmap.get())
 
         sequence_ids = pp.get().sequence_ids
@@ -322,9 +423,10 @@ def server(input, output, session):
             time.sleep(0.5)
 
     @reactive.effect(priority=-2)
-    @reactive.event(input.run_all_cgvt, input.run_step3_cgvt)
+    @reactive.event(input.run_all_cgvt, input.run_step3_cgvt, resume_cgvt)
     def _get_threshold_():
         req(pp.get())
+        req(not loading.get())
         req(phmap.get())
 
         sequence_ids = pp.get().sequence_ids
@@ -378,9 +480,10 @@ def server(input, output, session):
         save_generic_plot(figure_threshold, outfile)
 
     @reactive.effect(priority=-3)
-    @reactive.event(input.run_all_cgvt, input.run_step4_cgvt)
+    @reactive.event(input.run_all_cgvt, input.run_step4_cgvt, resume_cgvt)
     def _med_phmap_():
         req(pp.get())
+        req(not loading.get())
         req(phmap.get())
         req(threshold.get())
 
@@ -409,9 +512,10 @@ def server(input, output, session):
             time.sleep(0.5)
 
     @reactive.effect(priority=-4)
-    @reactive.event(input.run_all_cgvt, input.run_step5_cgvt)
+    @reactive.event(input.run_all_cgvt, input.run_step5_cgvt, resume_cgvt)
     def _fit_ellipse_():
         req(pp.get())
+        req(not loading.get())
         req(phmap.get())
 
         sequence_ids = pp.get().sequence_ids
@@ -436,9 +540,10 @@ def server(input, output, session):
             time.sleep(0.5)
 
     @reactive.effect(priority=-5)
-    @reactive.event(input.run_all_cgvt, input.run_step6_cgvt)
+    @reactive.event(input.run_all_cgvt, input.run_step6_cgvt, resume_cgvt)
     def _register_phmap_():
         req(pp.get())
+        req(not loading.get())
         req(phmap.get())
 
         sequence_ids = pp.get().sequence_ids
@@ -463,9 +568,10 @@ def server(input, output, session):
             time.sleep(0.5)
 
     @reactive.effect(priority=-6)
-    @reactive.event(input.run_all_cgvt, input.run_step7_cgvt)
+    @reactive.event(input.run_all_cgvt, input.run_step7_cgvt, resume_cgvt)
     def _get_uref_():
         req(pp.get())
+        req(not loading.get())
         req(phmap.get())
 
         sequence_ids = pp.get().sequence_ids
@@ -529,9 +635,10 @@ def server(input, output, session):
         save_generic_plot(figure_regmap, outfile)
 
     @reactive.effect(priority=-7)
-    @reactive.event(input.run_all_cgvt, input.run_step8_cgvt)
+    @reactive.event(input.run_all_cgvt, input.run_step8_cgvt, resume_cgvt)
     def _fit_zernike_():
         req(pp.get())
+        req(not loading.get())
         req(phmap.get())
         req(uref.get())
 
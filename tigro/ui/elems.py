@@ -91,6 +91,54 @@ def app_elems(pp):
             "Output path",
             value=pp.outpath,
         ),
+        ui.input_text(
+            "cache_dir",
+            "Cache directory",
+            value=pp.cache_dir or "",
+        ),
+        ui.input_numeric(
+            "cache_size",
+            "Cache size [GB]",
+            value=pp.cache_size,
+            min=0,
+        ),
+        ui.input_numeric(
+            "n_workers",
+            "Loading workers",
+            value=pp.n_workers,
+            min=1,
+        ),
+        ui.input_select(
+            "dtype",
+            "Precision",
+            choices=[
+                "float64",
+                "float32",
+            ],
+            selected=pp.dtype.name,
+        ),
+        ui.input_numeric(
+            "down_sampling",
+            "Down-sampling",
+            value=pp.down_sampling or 1,
+            min=1,
+        ),
+        ui.input_text(
+            "pyramid_levels",
+            "Pyramid levels",
+            value=pp._pyramid_levels,
+        ),
+        ui.input_text(
+            "crop",
+            "Crop (pupil or y0, y1, x0, x1)",
+            value=pp._crop,
+        ),
+        ui.input_numeric(
+            "crop_margin",
+            "Crop margin",
+            value=pp.crop_margin,
+            min=0,
+        ),
         ui.input_select(
             "loglevel",
             "Log level",
@@ -129,6 +177,14 @@ def app_elems(pp):
                             "Map",
                             choices=list(pp.sequence_ids.astype(str)),
                         ),
+                        ui.input_select(
+                            "select_2_system",
+                            "Resolution",
+                            choices={
+                                str(level): f"1/{level}" if level > 1 else "Full"
+                                for level in sorted({1, 2, 4, 8, *pp.pyramid_levels})
+                            },
+                        ),
                     ],
                     title="Options",
                     placement="top",
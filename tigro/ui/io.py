@@ -1,6 +1,22 @@
 from tigro.ui.shared import to_configparser
 
 
+def _int_input(value, default):
+    # Numeric inputs are None when left empty
+    try:
+        return str(int(value))
+    except (TypeError, ValueError):
+        return str(default)
+
+
+def _float_input(value, default):
+    # Numeric inputs are None when left empty
+    try:
+        return str(float(value))
+    except (TypeError, ValueError):
+        return str(default)
+
+
 def to_ini(input, tmp):
     dictionary = {}
 
@@ -17,6 +33,14 @@ def to_ini(input, tmp):
         system["fname_phmap"] = input.save_phmap_pkl()
     except:
         system["fname_phmap"] = "tigro.pkl"
+    system["n_workers"] = _int_input(input.n_workers(), 1)
+    system["cache_dir"] = input.cache_dir()
+    system["cache_size"] = _float_input(input.cache_size(), 10.0)
+    system["dtype"] = input.dtype()
+    system["down_sampling"] = _int_input(input.down_sampling(), 1)
+    system["pyramid_levels"] = input.pyramid_levels()
+    system["crop"] = input.crop()
+    system["crop_margin"] = _int_input(input.crop_margin(), 0)
     system["loglevel"] = input.loglevel()
 
     dictionary.update({"system": system})
@@ -1,16 +1,30 @@
 from .median_filter import median_filter
 from .flag_outliers import flag_outliers
 from .lsqellipse import LsqEllipseNew
-from .transform import transform
+from .transform import transform, transform_stack
 from .common_reference_frame import common_reference_frame
-from .psd import compute_psd, compute_psd_windowed
+from .psd import (
+    compute_psd,
+    compute_psd_windowed,
+    compute_psd_stack,
+    compute_psd_welch,
+    get_window2d,
+)
+from .pyramid import downsample, build_pyramid, add_pyramids
 
 __all__ = [
     "median_filter",
     "flag_outliers",
     "LsqEllipseNew",
     "transform",
+    "transform_stack",
     "common_reference_frame",
     "compute_psd",
     "compute_psd_windowed",
+    "compute_psd_stack",
+    "compute_psd_welch",
+    "get_window2d",
+    "downsample",
+    "build_pyramid",
+    "add_pyramids",
 ]
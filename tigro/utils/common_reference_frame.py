@@ -36,6 +36,8 @@ def common_reference_frame(meta, shape, crop_factor=0.0):
           Pixel coordinates of the aperture center.
         - ``a``, ``b`` : float
           Mean semi-major and semi-minor axes of the ellipse.
+        - ``crop_factor`` : float
+          The crop factor used to define the aperture.
         - ``yx`` : list of ndarray
           Normalized coordinate vectors ``[y, x]``.
         - ``polar_rho`` : np.ma.MaskedArray
@@ -69,6 +71,7 @@ def common_reference_frame(meta, shape, crop_factor=0.0):
         "yc": yc,
         "a": semi_major,
         "b": semi_minor,
+        "crop_factor": crop_factor,
         "yx": [y, x],
         "polar_rho": rho,
         "polar_phi": phi,
@@ -1,9 +1,76 @@
+import numpy as np
 from astropy.stats import sigma_clip
+from scipy.signal import medfilt2d
 from tigro.logging import logger
 from tigro.utils import median_filter
 
 
-def flag_outliers(sequence, rawmap, kernel_size=3, sigma=100):
+def _flag_frame(frame, kernel_size, sigma):
+    # Outlier mask of a single frame; masked means come back as float64,
+    # cast them so float32 frames are not promoted
+    mm = frame - frame.mean().astype(frame.dtype)
+    mm = median_filter(mm, kernel_size=kernel_size)
+    mm = frame - mm
+    mm = sigma_clip(mm, sigma=sigma, masked=True)
+    return mm.mask
+
+
+def _sort3(a, b, c):
+    # Elementwise sort of three arrays
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    mid, hi = np.minimum(hi, c), np.maximum(hi, c)
+    return np.minimum(lo, mid), np.maximum(lo, mid), hi
+
+
+def _med3(a, b, c):
+    # Elementwise median of three arrays
+    return np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+
+
+def _median3x3(ima, chunk_size=2**14):
+    # Exact 3x3 median with zero padding, as scipy.signal.medfilt2d. The
+    # columns of each window are sorted once and shared by the neighbouring
+    # windows; the median is then the median of the largest column minimum,
+    # the median column median and the smallest column maximum. Rows are
+    # processed in blocks of about `chunk_size` pixels, which stay in cache.
+    pad = np.pad(ima, 1)
+    retval = np.empty_like(ima)
+
+    step = max(1, chunk_size // ima.shape[1])
+    for i in range(0, ima.shape[0], step):
+        block = pad[i : i + step + 2]
+        lo, mid, hi = _sort3(block[:-2], block[1:-1], block[2:])
+        lo = np.maximum(np.maximum(lo[:, :-2], lo[:, 1:-1]), lo[:, 2:])
+        hi = np.minimum(np.minimum(hi[:, :-2], hi[:, 1:-1]), hi[:, 2:])
+        mid = _med3(mid[:, :-2], mid[:, 1:-1], mid[:, 2:])
+        retval[i : i + step] = _med3(lo, mid, hi)
+
+    return retval
+
+
+def _flag_stack(rawmap, kernel_size, sigma):
+    # Outlier mask of the whole (N, Y, X) stack: vectorized mean removal and
+    # filling, per-frame median filter, per-frame sigma clipping
+    mm = rawmap - rawmap.mean(axis=(-2, -1)).astype(rawmap.dtype)[:, None, None]
+    fill = np.ma.getdata(mm.mean(axis=(-2, -1))).astype(rawmap.dtype)
+    mm = np.where(np.ma.getmaskarray(mm), fill[:, None, None], mm.data)
+
+    # Frame by frame, so that the temporaries stay in cache
+    for num in range(mm.shape[0]):
+        if kernel_size == 3:
+            mm[num] = _median3x3(mm[num])
+        else:
+            mm[num] = medfilt2d(mm[num], kernel_size)
+
+    inf = np.isinf(mm)
+    mm[inf] = 0.0
+    mm = np.ma.masked_array(data=mm, mask=inf | np.ma.getmaskarray(rawmap))
+    mm = rawmap - mm
+    mm = sigma_clip(mm, sigma=sigma, axis=(-2, -1), masked=True)
+    return np.ma.getmaskarray(mm)
+
+
+def flag_outliers(sequence, rawmap, kernel_size=3, sigma=100, method="batch"):
     """
     Flag outlier pixels in a sequence of 2D maps using median filtering
     and sigma clipping.
@@ -33,6 +100,14 @@ def flag_outliers(sequence, rawmap, kernel_size=3, sigma=100):
         Sigma threshold for the sigma-clipping step.
         Default is 100.
 
+    method : {"batch", "loop"}, optional
+        Processing strategy. "batch" (default) removes the means and fills
+        the masked pixels of the whole stack at once, and sigma clips all
+        the frames in one call along axes ``(-2, -1)``. The default 3x3
+        median is computed with a vectorized sorting network instead of
+        :func:`scipy.signal.medfilt2d`. "loop" processes one frame at a
+        time with :func:`tigro.utils.median_filter`.
+
     Returns
     -------
     numpy.ma.MaskedArray
@@ -41,19 +116,25 @@ def flag_outliers(sequence, rawmap, kernel_size=3, sigma=100):
 
     Notes
     -----
-    - The median filtering is performed frame by frame.
+    - Both methods flag the same pixels; "batch" trades memory (a few
+      temporary copies of the stack) for speed, about 4x on 1024x1024
+      frames with the default kernel (see
+      ``benchmarks/bench_flag_outliers.py``).
     - Sigma clipping is applied to the residuals after background removal.
     - This function does not modify the input `rawmap` in place.
+    - Single precision inputs are filtered in single precision.
 
     """
 
     logger.info("Filtering sequence {:3d}".format(sequence))
     retval = rawmap.copy()
-    for num in range(rawmap.shape[0]):
-        mm = rawmap[num] - rawmap[num].mean()
-        mm = median_filter(mm, kernel_size=kernel_size)
-        mm = rawmap[num, ...] - mm
-        mm = sigma_clip(mm, sigma=sigma, masked=True)
-        retval[num].mask |= mm.mask
+
+    if method == "loop":
+        for num in range(rawmap.shape[0]):
+            retval[num].mask |= _flag_frame(rawmap[num], kernel_size, sigma)
+    elif method == "batch":
+        retval.mask |= _flag_stack(rawmap, kernel_size, sigma)
+    else:
+        raise ValueError(f"Unknown method: {method}")
 
     return retval
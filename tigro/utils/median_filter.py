@@ -1,16 +1,85 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.signal import medfilt2d as mfilt
 
 
-def median_filter(ima, kernel_size=3):
-    if hasattr(ima, "mask"):
-        ima_ = ima.filled(fill_value=ima.mean())
-        retval = mfilt(ima_, kernel_size)
-        mask = np.isinf(retval)
-        retval[mask] = 0.0
-        retval = np.ma.masked_array(data=retval, mask=mask | ima.mask)
+def _nanmedian_filter(data, valid, kernel_size, chunk_size=2**22):
+    # Sliding-window median ignoring invalid pixels, restricted to the
+    # bounding box of the valid region. Invalid pixels are set to NaN,
+    # which np.sort moves to the end of each window, so the median is
+    # picked among the first `count` sorted values.
+    retval = np.full(data.shape, np.nan, dtype=data.dtype)
+
+    rows = np.flatnonzero(valid.any(axis=1))
+    cols = np.flatnonzero(valid.any(axis=0))
+    if rows.size == 0:
+        return retval
+
+    y0, y1 = rows[0], rows[-1] + 1
+    x0, x1 = cols[0], cols[-1] + 1
+    r = kernel_size // 2
+
+    box = np.where(valid[y0:y1, x0:x1], data[y0:y1, x0:x1], np.nan)
+    box = np.pad(box, r, mode="constant", constant_values=np.nan)
+    windows = sliding_window_view(box, (kernel_size, kernel_size))
+
+    step = max(1, chunk_size // (windows.shape[1] * kernel_size**2))
+    for i in range(0, windows.shape[0], step):
+        ww = windows[i : i + step].reshape(*windows[i : i + step].shape[:2], -1)
+        ww = np.sort(ww, axis=-1)
+        count = np.count_nonzero(~np.isnan(ww), axis=-1)[..., None]
+        lo = np.take_along_axis(ww, (count - 1) // 2, axis=-1)
+        hi = np.take_along_axis(ww, count // 2, axis=-1)
+        retval[y0 + i : y0 + i + ww.shape[0], x0:x1] = 0.5 * (lo + hi)[..., 0]
+
+    return retval
+
+
+def median_filter(ima, kernel_size=3, method="fill"):
+    """
+    Apply a 2D median filter to an image, optionally honouring its mask.
+
+    Parameters
+    ----------
+    ima : numpy.ndarray or numpy.ma.MaskedArray
+        Input 2D image.
+    kernel_size : int, optional
+        Size of the square (odd) median kernel. Default is 3.
+    method : {"fill", "nan"}, optional
+        "fill" (default) fills masked pixels with the image mean and runs
+        :func:`scipy.signal.medfilt2d` on the whole frame. "nan" computes
+        the median over the valid pixels of each window only, within the
+        bounding box of the unmasked region, so pixels near the pupil edge
+        are not biased towards the mean. For plain arrays, non-finite
+        pixels are treated as invalid.
+
+    Returns
+    -------
+    numpy.ndarray or numpy.ma.MaskedArray
+        Filtered image. Masked inputs return a masked array carrying the
+        input mask.
+    """
+    if method == "fill":
+        if hasattr(ima, "mask"):
+            ima_ = ima.filled(fill_value=ima.mean())
+            retval = mfilt(ima_, kernel_size)
+            mask = np.isinf(retval)
+            retval[mask] = 0.0
+            retval = np.ma.masked_array(data=retval, mask=mask | ima.mask)
+        else:
+            ima_ = ima
+            retval = mfilt(ima_, kernel_size)
+    elif method == "nan":
+        if hasattr(ima, "mask"):
+            retval = _nanmedian_filter(
+                ima.data, ~np.ma.getmaskarray(ima), kernel_size
+            )
+            mask = np.isnan(retval)
+            retval[mask] = 0.0
+            retval = np.ma.masked_array(data=retval, mask=mask | ima.mask)
+        else:
+            retval = _nanmedian_filter(ima, np.isfinite(ima), kernel_size)
     else:
-        ima_ = ima
-        retval = mfilt(ima_, kernel_size)
+        raise ValueError(f"Unknown method: {method}")
 
     return retval
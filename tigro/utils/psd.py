@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from functools import lru_cache
 
+from scipy import fft
 from scipy.signal import get_window
 
 
@@ -114,6 +116,61 @@ def make_ellipse_window2d(shape, ellipse):
     return w
 
 
+_ELLIPSE_KEYS = ("a", "b", "xc", "yc", "phi")
+
+
+@lru_cache(maxsize=16)
+def _window2d(shape, window, ellipse):
+    # The window is shared by all callers: make it read-only
+    if ellipse is not None:
+        w = make_ellipse_window2d(shape, dict(zip(_ELLIPSE_KEYS, ellipse)))
+        data, mask = w.data, np.ma.getmaskarray(w)
+        data.flags.writeable = False
+        mask.flags.writeable = False
+        return np.ma.MaskedArray(data, mask=mask)
+
+    w = make_window2d(shape, window=window)
+    w.flags.writeable = False
+    return w
+
+
+def get_window2d(shape, window="hann", ellipse=None, decimals=3):
+    """
+    Return a memoized 2D window for PSD estimation.
+
+    Windows are built with :func:`make_window2d` or, if `ellipse` is given,
+    :func:`make_ellipse_window2d`, and kept in a bounded LRU cache keyed on
+    the shape, the window specification and the ellipse parameters rounded
+    to `decimals`, so the frames of a campaign, which share a shape and
+    nearly the same pupil, reuse the same window.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Window shape as (ny, nx).
+    window : str or tuple, optional
+        Window specification passed to :func:`make_window2d`
+        (default: "hann"). Ignored if `ellipse` is given.
+    ellipse : dict, optional
+        Ellipse definition, see :func:`make_ellipse_window2d`.
+        Default is None.
+    decimals : int, optional
+        Number of decimals the ellipse parameters are rounded to, in pixels
+        and radians (default: 3). The window is evaluated on the rounded
+        parameters.
+
+    Returns
+    -------
+    w : ndarray or numpy.ma.MaskedArray
+        Window, shared with the cache and therefore read-only.
+    """
+    if ellipse:
+        ellipse = tuple(round(float(ellipse[key]), decimals) for key in _ELLIPSE_KEYS)
+    else:
+        ellipse = None
+    return _window2d(tuple(shape), window, ellipse)
+
+
 def compute_numerical_error(data, bins, psd, verbose=True):
     """
     Estimate numerical error of a radially binned PSD via a Parseval consistency check.
@@ -164,7 +221,15 @@ def compute_numerical_error(data, bins, psd, verbose=True):
     return err
 
 
-def compute_psd(data, nbins, delta_d=1.0, remove_dc_offs=True, verbose=True):
+def compute_psd(
+    data,
+    nbins,
+    delta_d=1.0,
+    remove_dc_offs=True,
+    verbose=True,
+    real=False,
+    workers=None,
+):
     """
     Compute a radially averaged (isotropic) 2D power spectral density (PSD).
 
@@ -197,6 +262,15 @@ def compute_psd(data, nbins, delta_d=1.0, remove_dc_offs=True, verbose=True):
     verbose : bool, optional
         If True (default), prints a numerical consistency error estimate based on
         a Parseval-type check (see Notes).
+    real : bool, optional
+        If True, uses the real-input :func:`scipy.fft.rfft2`, which computes and
+        stores only the non-negative `fx` half plane, and bins it directly on the
+        unshifted frequency grid with a cached radial bin map (see
+        :func:`compute_psd_stack`). The binned PSD is the same as with the
+        default full complex FFT (default: False).
+    workers : int, optional
+        Number of threads used by :mod:`scipy.fft`. Default is None (single
+        thread).
 
     Returns
     -------
@@ -210,7 +284,8 @@ def compute_psd(data, nbins, delta_d=1.0, remove_dc_offs=True, verbose=True):
     dataf : ndarray, shape data.shape
         Shifted 2D periodogram-like array used for binning:
         `fftshift(|fft2(data_filled)|^2)` with an additional normalization by
-        `(ny * nx)`.
+        `(ny * nx)`. If `real` is True, the unshifted half plane
+        `|rfft2(data_filled)|^2 / (ny * nx)` of shape `(ny, nx // 2 + 1)` instead.
     ff : ndarray, shape (len(bins) - 1,)
         Radial frequency bin centers (midpoints of consecutive `bins` edges).
     error : float
@@ -221,6 +296,8 @@ def compute_psd(data, nbins, delta_d=1.0, remove_dc_offs=True, verbose=True):
     -----
     - **Masked / non-finite data**: If `data` is not masked, NaN/Inf values are masked.
     The FFT is performed on `data.filled(0)`, so masked samples contribute zero.
+    - **Precision**: The FFT is computed with :mod:`scipy.fft`, in single precision
+    for ``float32`` data; the binning is always accumulated in double precision.
     - **Radial binning**: Uses `scipy.stats.binned_statistic(..., statistic="sum")`
     on the flattened radial frequency map and the flattened 2D periodogram.
     - **Normalization**: The 2D periodogram is scaled by `1/(ny*nx)`. The binned sum
@@ -240,20 +317,33 @@ def compute_psd(data, nbins, delta_d=1.0, remove_dc_offs=True, verbose=True):
     if remove_dc_offs:
         data -= data.mean()
 
-    dataf = np.abs(np.fft.fft2(data.filled(0)))
-    dataf = np.fft.fftshift(dataf**2)
-    dataf /= data.shape[0] * data.shape[1]
-    fx = np.fft.fftshift(np.fft.fftfreq(data.shape[1], d=delta_d))
-    fy = np.fft.fftshift(np.fft.fftfreq(data.shape[0], d=delta_d))
-
-    fxx, fyy = np.meshgrid(fx, fy)
-    freq = np.sqrt(fxx**2 + fyy**2)
-
     if nbins is None:
         nbins = min(data.shape[1] // 2, data.shape[0] // 2)
-    bins = np.linspace(freq.min(), freq.max(), nbins)
 
-    psd, _, _ = binned_statistic(freq.ravel(), dataf.ravel(), "sum", bins=bins)
+    if real:
+        index, weights, bins = _radial_bin_index(data.shape, float(delta_d), nbins)
+
+        dataf = fft.rfft2(data.filled(0), workers=workers)
+        dataf = dataf.real**2 + dataf.imag**2
+        dataf /= data.shape[0] * data.shape[1]
+
+        psd = np.bincount(
+            index.ravel(), (dataf * weights).ravel(), minlength=nbins
+        )[:-1]
+    else:
+        # scipy.fft keeps single precision inputs in complex64
+        dataf = np.abs(fft.fft2(data.filled(0), workers=workers))
+        dataf = fft.fftshift(dataf**2)
+        dataf /= data.shape[0] * data.shape[1]
+        fx = fft.fftshift(fft.fftfreq(data.shape[1], d=delta_d))
+        fy = fft.fftshift(fft.fftfreq(data.shape[0], d=delta_d))
+
+        fxx, fyy = np.meshgrid(fx, fy)
+        freq = np.sqrt(fxx**2 + fyy**2)
+
+        bins = np.linspace(freq.min(), freq.max(), nbins)
+
+        psd, _, _ = binned_statistic(freq.ravel(), dataf.ravel(), "sum", bins=bins)
     psd /= np.diff(bins)
     psd /= data.count()
 
@@ -272,6 +362,8 @@ def compute_psd_windowed(
     verbose=True,
     ellipse=None,
     plot=False,
+    real=False,
+    workers=None,
 ):
     """
     Compute a radially averaged PSD from 2D data after applying a 2D window.
@@ -300,10 +392,15 @@ def compute_psd_windowed(
     ellipse : dict or None, optional
         If provided, defines an elliptical Hann window/mask via
         :func:`make_ellipse_window2d`. If None, a separable 2D window is used.
-        See :func:`make_ellipse_window2d` for required keys.
+        See :func:`make_ellipse_window2d` for required keys. Windows are
+        memoized with :func:`get_window2d`.
     plot : bool, optional
         If True, displays the original data and the windowed data side-by-side
         using Matplotlib (default: False).
+    real : bool, optional
+        Passed through to :func:`compute_psd` (default: False).
+    workers : int, optional
+        Passed through to :func:`compute_psd` (default: None).
 
     Returns
     -------
@@ -325,12 +422,10 @@ def compute_psd_windowed(
     if remove_dc_offs:
         data -= data.mean()
 
-    if ellipse:
-        w2d = make_ellipse_window2d(shape=data.shape, ellipse=ellipse)
-    else:
-        w2d = make_window2d(data.shape)
+    w2d = get_window2d(data.shape, ellipse=ellipse)
 
-    data_win = data * w2d
+    # Do not promote single precision data
+    data_win = data * w2d.astype(np.result_type(data.dtype, np.float32), copy=False)
 
     if plot:
         fig, axs = plt.subplots(1, 2)
@@ -344,4 +439,244 @@ def compute_psd_windowed(
         delta_d=delta_d,
         remove_dc_offs=True,
         verbose=verbose,
+        real=real,
+        workers=workers,
     )
+
+
+@lru_cache(maxsize=8)
+def _radial_bin_index(shape, delta_d, nbins):
+    # Radial bin of every rfft2 sample, with the bin edges of compute_psd.
+    # Out-of-range samples go to the extra bin `nbins - 1`, dropped later.
+    from scipy.stats import binned_statistic
+
+    ny, nx = shape
+    fx = fft.rfftfreq(nx, d=delta_d)
+    fy = fft.fftfreq(ny, d=delta_d)
+    fxx, fyy = np.meshgrid(fx, fy)
+    freq = np.sqrt(fxx**2 + fyy**2)
+
+    # The half plane holds every |fx| and fy of the full grid, hence the
+    # same extrema, and binned_statistic applies the same edge rules
+    bins = np.linspace(freq.min(), freq.max(), nbins)
+    binnumber = binned_statistic(freq.ravel(), None, "count", bins=bins).binnumber
+    index = np.where(
+        (binnumber >= 1) & (binnumber < nbins), binnumber - 1, nbins - 1
+    ).astype(np.intp)
+
+    # Columns other than DC and Nyquist stand for two conjugate samples
+    weights = np.full(fx.size, 2.0)
+    weights[0] = 1.0
+    if nx % 2 == 0:
+        weights[-1] = 1.0
+
+    for array in (index, weights, bins):
+        array.flags.writeable = False
+
+    return index, weights, bins
+
+
+def compute_psd_stack(data, nbins, delta_d=1.0, remove_dc_offs=True, workers=None):
+    """
+    Compute the radially averaged PSD of every frame of a stack.
+
+    Stack counterpart of :func:`compute_psd`, with the same normalization
+    and bin edges. The FFTs of all frames are computed at once with a real
+    input :func:`scipy.fft.rfft2` over the last two axes, which only holds
+    the non-negative ``fx`` half plane; the radial bin of each half-plane
+    sample is computed once per ``(shape, delta_d, nbins)`` and cached, and
+    the binned sums are accumulated with :func:`numpy.bincount`, counting
+    twice the samples that stand for a conjugate pair.
+
+    Parameters
+    ----------
+    data : array_like or numpy.ma.MaskedArray
+        Input stack of shape (N, Ny, Nx). Non-finite values are masked if
+        `data` is not already a masked array. Masked samples are filled
+        with zeros for the FFT. `data` is not modified.
+    nbins : int or None
+        Number of radial frequency bin edges. If None, a default is chosen
+        as `min(ny//2, nx//2)`.
+    delta_d : float, optional
+        Sample spacing in the spatial domain (default: 1.0).
+    remove_dc_offs : bool, optional
+        If True (default), subtracts the mean of each frame before the FFT.
+    workers : int, optional
+        Number of threads used by :func:`scipy.fft.rfft2`. Default is None
+        (single thread).
+
+    Returns
+    -------
+    psd : ndarray, shape (N, nbins - 1)
+        Radially binned PSD of each frame.
+    bins : ndarray, shape (nbins,)
+        Radial frequency bin edges, as in :func:`compute_psd`.
+    ff : ndarray, shape (nbins - 1,)
+        Radial frequency bin centers.
+    error : ndarray, shape (N,)
+        Parseval consistency error of each frame, as returned by
+        :func:`compute_numerical_error`.
+    """
+    if not hasattr(data, "mask"):
+        data = np.asarray(data)
+        data = np.ma.MaskedArray(data, ~np.isfinite(data))
+
+    if remove_dc_offs:
+        data = data - data.mean(axis=(-2, -1))[:, None, None]
+
+    nframes, ny, nx = data.shape
+    if nbins is None:
+        nbins = min(nx // 2, ny // 2)
+    index, weights, bins = _radial_bin_index((ny, nx), float(delta_d), nbins)
+
+    dataf = fft.rfft2(data.filled(0), axes=(-2, -1), workers=workers)
+    power = dataf.real**2 + dataf.imag**2
+    power *= weights
+    power /= ny * nx
+
+    psd = np.empty((nframes, nbins - 1))
+    for i in range(nframes):
+        psd[i] = np.bincount(index.ravel(), power[i].ravel(), minlength=nbins)[:-1]
+    psd /= np.diff(bins)
+    psd /= data.count(axis=(-2, -1))[:, None]
+
+    ff = 0.5 * (bins[1:] + bins[:-1])
+
+    df = bins[1] - bins[0]
+    error = 1 - np.sum(psd * df, axis=-1) / data.var(axis=(-2, -1))
+
+    return psd, bins, ff, np.ma.getdata(error)
+
+
+def _tiles(ima, tile, overlap):
+    # Overlapping (ty, tx) tiles of a 2D map, as views
+    ty, tx = tile
+    sy = max(1, int(round(ty * (1.0 - overlap))))
+    sx = max(1, int(round(tx * (1.0 - overlap))))
+    for y0 in range(0, ima.shape[0] - ty + 1, sy):
+        for x0 in range(0, ima.shape[1] - tx + 1, sx):
+            yield ima[y0 : y0 + ty, x0 : x0 + tx]
+
+
+def compute_psd_welch(
+    frames,
+    nbins,
+    delta_d=1.0,
+    window="hann",
+    ellipse=None,
+    tile=None,
+    overlap=0.5,
+    min_valid=0.5,
+    workers=None,
+):
+    """
+    Compute a Welch-style averaged radial PSD over frames or sub-apertures.
+
+    Segments are either the frames of a sequence, streamed one at a time
+    from any iterable (e.g. a generator reading them from disk), or the
+    overlapping tiles of a single large map. Each segment has its mean
+    removed, is multiplied by a memoized window (:func:`get_window2d`) and
+    its radial PSD is computed with the real-input FFT of
+    :func:`compute_psd`. Only the running mean and sum of squared
+    deviations of each bin are kept (Welford's algorithm), so memory does
+    not grow with the number of segments.
+
+    Parameters
+    ----------
+    frames : iterable of array_like, or array_like
+        Iterable of 2D maps of the same shape or, if `tile` is given, a
+        single 2D map. Non-finite values are masked if the maps are not
+        masked arrays. The input is not modified.
+    nbins : int or None
+        Number of radial frequency bin edges, as in :func:`compute_psd`.
+    delta_d : float, optional
+        Sample spacing in the spatial domain (default: 1.0).
+    window : str or tuple, optional
+        Window specification passed to :func:`get_window2d`
+        (default: "hann").
+    ellipse : dict, optional
+        If given, the elliptical taper of :func:`make_ellipse_window2d` is
+        used instead of `window`. Only meaningful for whole frames.
+        Default is None.
+    tile : tuple of int, optional
+        Tile shape (ty, tx). If given, `frames` is a single map split into
+        overlapping tiles. Default is None.
+    overlap : float, optional
+        Fractional overlap of consecutive tiles along each axis
+        (default: 0.5).
+    min_valid : float, optional
+        Segments with a smaller fraction of unmasked pixels, e.g. tiles
+        straddling the pupil edge, are skipped (default: 0.5).
+    workers : int, optional
+        Number of threads used by :mod:`scipy.fft`. Default is None.
+
+    Returns
+    -------
+    psd : ndarray, shape (nbins - 1,)
+        Mean PSD over the segments.
+    sem : ndarray, shape (nbins - 1,)
+        Standard error of the mean PSD. NaN if fewer than two segments.
+    bins : ndarray, shape (nbins,)
+        Radial frequency bin edges.
+    ff : ndarray, shape (nbins - 1,)
+        Radial frequency bin centers.
+    count : int
+        Number of segments averaged.
+
+    Raises
+    ------
+    ValueError
+        If no segment passes `min_valid` or if the segments do not share
+        the same shape.
+    """
+    if tile is not None:
+        frames = _tiles(frames, tile, overlap)
+
+    count = 0
+    shape = mean = m2 = bins = None
+    for frame in frames:
+        if not hasattr(frame, "mask"):
+            frame = np.asarray(frame)
+            frame = np.ma.MaskedArray(frame, ~np.isfinite(frame))
+
+        if frame.count() < min_valid * frame.size:
+            continue
+        if shape is None:
+            shape = frame.shape
+        elif frame.shape != shape:
+            raise ValueError(f"Segment shape {frame.shape} differs from {shape}")
+
+        w2d = get_window2d(shape, window=window, ellipse=ellipse)
+        w2d = w2d.astype(np.result_type(frame.dtype, np.float32), copy=False)
+        segment = (frame - frame.mean()) * w2d
+
+        psd, bins, _, _, _ = compute_psd(
+            segment,
+            nbins=nbins,
+            delta_d=delta_d,
+            remove_dc_offs=True,
+            verbose=False,
+            real=True,
+            workers=workers,
+        )
+
+        # Welford update of the per-bin mean and squared deviations
+        count += 1
+        if mean is None:
+            mean = np.zeros_like(psd)
+            m2 = np.zeros_like(psd)
+        delta = psd - mean
+        mean += delta / count
+        m2 += delta * (psd - mean)
+
+    if count == 0:
+        raise ValueError("No segment with enough valid pixels")
+
+    if count > 1:
+        sem = np.sqrt(m2 / (count - 1) / count)
+    else:
+        sem = np.full_like(mean, np.nan)
+
+    ff = 0.5 * (bins[1:] + bins[:-1])
+
+    return mean, sem, bins, ff, count
@@ -0,0 +1,149 @@
+import numpy as np
+
+
+def _block_sum(data, factor):
+    # Sum over non-overlapping factor x factor blocks of the last two axes,
+    # zero padding the trailing partial blocks
+    ny, nx = data.shape[-2:]
+    py, px = -ny % factor, -nx % factor
+    if py or px:
+        pad = [(0, 0)] * (data.ndim - 2) + [(0, py), (0, px)]
+        data = np.pad(data, pad)
+
+    ny, nx = data.shape[-2:]
+    shape = data.shape[:-2] + (ny // factor, factor, nx // factor, factor)
+    return data.reshape(shape).sum(axis=(-3, -1))
+
+
+def _to_sums(ima):
+    # Zero-filled data, valid pixel counts and data type of a map
+    if hasattr(ima, "mask"):
+        valid = ~np.ma.getmaskarray(ima)
+    else:
+        valid = np.isfinite(ima)
+    data = np.where(valid, np.ma.getdata(ima), 0)
+    return data, valid.astype(np.int32), data.dtype
+
+
+def _from_sums(total, count, dtype, factor):
+    # Block-reduce sums and counts and return the masked mean with them
+    total = _block_sum(total, factor)
+    count = _block_sum(count, factor)
+    mean = np.divide(
+        total, count, out=np.zeros(total.shape, dtype=dtype), where=count > 0
+    )
+    mean = np.ma.MaskedArray(mean, mask=count == 0, fill_value=0.0)
+    return mean, total, count
+
+
+def downsample(ima, factor):
+    """
+    Mask-aware area-average downsampling of a map or a stack of maps.
+
+    Every ``factor x factor`` block of the last two axes is replaced by the
+    mean of its unmasked pixels. Blocks without unmasked pixels are
+    masked. Trailing rows and columns that do not fill a whole block are
+    averaged over the pixels available.
+
+    Parameters
+    ----------
+    ima : numpy.ma.MaskedArray or numpy.ndarray
+        Input map of shape (..., Ny, Nx). For plain arrays, non-finite
+        pixels are treated as masked.
+    factor : int
+        Downsampling factor along both axes.
+
+    Returns
+    -------
+    numpy.ma.MaskedArray
+        Downsampled map of shape (..., ceil(Ny/factor), ceil(Nx/factor)).
+    """
+    return _from_sums(*_to_sums(ima), factor)[0]
+
+
+def build_pyramid(ima, levels=(2, 4, 8)):
+    """
+    Build a multi-resolution pyramid of a map or a stack of maps.
+
+    Each level is the mask-aware area average of :func:`downsample`, so,
+    unlike plain striding, the coarse levels do not alias the data. Levels
+    are built from the nearest finer level whose factor divides theirs,
+    carrying the block sums and pixel counts, so the result is the same as
+    downsampling the full-resolution map directly.
+
+    Parameters
+    ----------
+    ima : numpy.ma.MaskedArray or numpy.ndarray
+        Full-resolution map of shape (..., Ny, Nx).
+    levels : iterable of int, optional
+        Downsampling factors (default: ``(2, 4, 8)``).
+
+    Returns
+    -------
+    dict
+        ``pyramid[factor]`` is the downsampled map, as a masked array.
+
+    Examples
+    --------
+    >>> pyramid = build_pyramid(rawmap)
+    >>> plt.imshow(pyramid[4][0])
+    """
+    total, count, dtype = _to_sums(ima)
+    sums = {1: (total, count)}
+
+    pyramid = {}
+    for factor in sorted(set(int(level) for level in levels)):
+        base = max(f for f in sums if factor % f == 0)
+        total, count = sums[base]
+        pyramid[factor], total, count = _from_sums(
+            total, count, dtype, factor // base
+        )
+        sums[factor] = total, count
+
+    return pyramid
+
+
+def _stack(data):
+    # (N, Ny, Nx) stack of the maps of a sequence, sorted by measurement
+    # number, as in tigro.io.load.sort_phmap
+    if hasattr(data, "to_masked"):
+        return data.to_masked()
+    return np.ma.stack([data[num] for num in sorted(data, key=int)])
+
+
+def add_pyramids(phmap, levels):
+    """
+    Build the quick-look pyramid of every sequence.
+
+    Parameters
+    ----------
+    phmap : dict or tuple
+        Either processed phase maps, with the raw stack in
+        ``phmap[sequence]["rawmap"]``, or the ``(retval, metadata)`` tuple
+        returned by :func:`tigro.io.load.load_phmap`, whose maps are
+        stacked by measurement number first.
+    levels : iterable of int
+        Downsampling factors, see :func:`build_pyramid`. Nothing is done if
+        empty.
+
+    Returns
+    -------
+    dict or tuple
+        `phmap`, with the pyramid stored in ``phmap[sequence]["pyramid"]``,
+        which is where :func:`tigro.plots.plot.plot_sag_quicklook` looks
+        for it, or, for the output of ``load_phmap``, in
+        ``metadata[sequence]["pyramid"]``, which
+        :func:`tigro.io.load.sort_phmap` carries over.
+    """
+    if not levels:
+        return phmap
+
+    if isinstance(phmap, tuple):
+        data, metadata = phmap
+        for sequence, _data in data.items():
+            metadata[sequence]["pyramid"] = build_pyramid(_stack(_data), levels)
+        return phmap
+
+    for item in phmap.values():
+        item["pyramid"] = build_pyramid(item["rawmap"], levels)
+    return phmap
@@ -1,5 +1,6 @@
 import numpy as np
 import cv2
+from concurrent.futures import ThreadPoolExecutor
 
 
 def transform(map, xc, yc, Dx, Dy, phi, flags=cv2.INTER_AREA, borderValue=np.nan):
@@ -39,3 +40,77 @@ def transform(map, xc, yc, Dx, Dy, phi, flags=cv2.INTER_AREA, borderValue=np.nan
         map.filled(np.nan), RM, map.shape, flags=flags, borderValue=borderValue
     )
     return np.ma.MaskedArray(M_, np.isnan(M_))
+
+
+def transform_stack(
+    maps,
+    xc,
+    yc,
+    Dx,
+    Dy,
+    phi,
+    flags=cv2.INTER_AREA,
+    borderValue=np.nan,
+    n_workers=None,
+):
+    """
+    Apply a rigid 2D transformation to every frame of a stack.
+
+    Stack counterpart of :func:`transform`. All rotation matrices are built
+    up front, the masked frames are filled with NaN in a single pass, and
+    the frames are warped concurrently in a thread pool (OpenCV releases
+    the GIL) straight into a preallocated output cube, whose mask is then
+    rebuilt once from the NaNs.
+
+    Parameters
+    ----------
+    maps : np.ma.MaskedArray or np.ndarray
+        Input stack of shape (N, Ny, Nx). Plain arrays are expected to mark
+        invalid pixels with NaN.
+    xc, yc : float or array_like
+        Coordinates of the rotation centers (in pixel units), scalars or one
+        per frame.
+    Dx, Dy : float or array_like
+        Translations applied after rotation, scalars or one per frame.
+    phi : float or array_like
+        Rotation angles in radians (counterclockwise), scalars or one per
+        frame.
+    flags : int, optional
+        OpenCV interpolation flag passed to ``cv2.warpAffine``
+        (default: ``cv2.INTER_AREA``).
+    borderValue : float, optional
+        Value used for pixels outside the transformed image domain
+        (default: ``np.nan``).
+    n_workers : int, optional
+        Number of threads. Default is None, which lets
+        :class:`concurrent.futures.ThreadPoolExecutor` decide.
+
+    Returns
+    -------
+    np.ma.MaskedArray
+        Transformed stack of shape (N, Ny, Nx), masked where NaN.
+    """
+    nframes, ny, nx = maps.shape
+    xc, yc, Dx, Dy, phi = (
+        np.broadcast_to(np.asarray(p, dtype=float), (nframes,))
+        for p in (xc, yc, Dx, Dy, phi)
+    )
+
+    RM = np.empty((nframes, 2, 3))
+    for i in range(nframes):
+        RM[i] = cv2.getRotationMatrix2D((xc[i], yc[i]), np.rad2deg(phi[i]), 1.0)
+    RM[:, 0, -1] += Dx
+    RM[:, 1, -1] += Dy
+
+    src = np.ascontiguousarray(np.ma.filled(maps, np.nan))
+    out = np.empty_like(src)
+
+    def warp(i):
+        cv2.warpAffine(
+            src[i], RM[i], (nx, ny), dst=out[i], flags=flags, borderValue=borderValue
+        )
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        list(executor.map(warp, range(nframes)))
+
+    return np.ma.MaskedArray(out, np.isnan(out))